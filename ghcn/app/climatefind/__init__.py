@@ -1,4 +1,14 @@
 from .main import *
 from .utils import *
+from . import summary
+from . import tiles
+from . import render
+from . import binning
+from . import preview
+from . import grid
+from . import sweep
+from . import rules
+from . import comfort
+from . import hourly
 
 __version__ = '0.1.0'
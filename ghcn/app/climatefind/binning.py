@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+# Core
+import math
+
+# Contrib
+import branca.element
+import folium
+import jinja2
+import numpy
+import pandas
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+SQRT_3 = math.sqrt(3)
+
+class ZoomLayerToggle(branca.element.MacroElement):
+  """
+  Only keep each layer on the map while the zoom is within its
+  [min_zoom, max_zoom) range.
+  """
+  _template = jinja2.Template("""
+    {% macro script(this, kwargs) %}
+    (function() {
+      var map = {{ this._parent.get_name() }};
+      var layers = [
+        {%- for layer, min_zoom, max_zoom in this.layers %}
+        [{{ layer.get_name() }}, {{ min_zoom }}, {{ max_zoom }}],
+        {%- endfor %}
+      ];
+      function update() {
+        var zoom = map.getZoom();
+        layers.forEach(function(l) {
+          if (zoom >= l[1] && zoom < l[2]) {
+            if (!map.hasLayer(l[0])) { map.addLayer(l[0]); }
+          } else if (map.hasLayer(l[0])) {
+            map.removeLayer(l[0]);
+          }
+        });
+      }
+      map.on('zoomend', update);
+      update();
+    })();
+    {% endmacro %}
+  """)
+
+  def __init__(self, layers):
+    """
+    :param layers: List of (layer, min_zoom, max_zoom) tuples
+    """
+    super().__init__()
+    self._name = 'ZoomLayerToggle'
+    self.layers = layers
+
+def square_bin_keys(x, y, size):
+  """
+  :return: (ix, iy) integer bin keys of the `size` square containing each point
+  """
+  return (
+    numpy.floor(x / size).astype(numpy.int64),
+    numpy.floor(y / size).astype(numpy.int64),
+  )
+
+def square_bin_centers(ix, iy, size):
+  return (ix + 0.5) * size, (iy + 0.5) * size
+
+def hex_bin_keys(x, y, size):
+  """
+  Assign each point to the pointy-top hexagon of center-to-corner `size` that
+  contains it by rounding its fractional cube coordinates.
+
+  :return: (q, r) integer axial bin keys
+  """
+  q = ((SQRT_3 / 3) * x - (1 / 3) * y) / size
+  r = ((2 / 3) * y) / size
+  s = -q - r
+  rq = numpy.round(q)
+  rr = numpy.round(r)
+  rs = numpy.round(s)
+  dq = numpy.abs(rq - q)
+  dr = numpy.abs(rr - r)
+  ds = numpy.abs(rs - s)
+  fix_q = (dq > dr) & (dq > ds)
+  fix_r = ~fix_q & (dr > ds)
+  rq = numpy.where(fix_q, -rr - rs, rq)
+  rr = numpy.where(fix_r, -rq - rs, rr)
+  return rq.astype(numpy.int64), rr.astype(numpy.int64)
+
+def hex_bin_centers(q, r, size):
+  return size * SQRT_3 * (q + (r / 2)), size * 1.5 * r
+
+def hex_corners(x, y, size):
+  """
+  :return: x and y arrays of shape (bins, 7) tracing each hexagon's closed ring
+  """
+  angles = numpy.radians(30 + (60 * numpy.arange(7)))
+  return (
+    x[:, numpy.newaxis] + size * numpy.cos(angles),
+    y[:, numpy.newaxis] + size * numpy.sin(angles),
+  )
+
+def square_corners(x, y, size):
+  dx = numpy.array([-0.5, 0.5, 0.5, -0.5, -0.5]) * size
+  dy = numpy.array([-0.5, -0.5, 0.5, 0.5, -0.5]) * size
+  return x[:, numpy.newaxis] + dx, y[:, numpy.newaxis] + dy
+
+def bin_values(x, y, values, size, kind='hex'):
+  """
+  Aggregate point `values` into hexagonal or square bins of `size` (in the
+  units of `x` and `y`).
+
+  :return: DataFrame of one row per non-empty bin with its key, center, count, mean, min and max
+  """
+  values = numpy.asarray(values, dtype=numpy.float64)
+  if kind == 'hex':
+    keys = hex_bin_keys(x, y, size)
+  else:
+    keys = square_bin_keys(x, y, size)
+  unique_keys, inverse = numpy.unique(numpy.column_stack(keys), axis=0, return_inverse=True)
+  inverse = inverse.ravel()
+  num_bins = len(unique_keys)
+
+  count = numpy.bincount(inverse, minlength=num_bins)
+  mean = numpy.bincount(inverse, weights=values, minlength=num_bins) / count
+  vmin = numpy.full(num_bins, numpy.inf)
+  vmax = numpy.full(num_bins, -numpy.inf)
+  numpy.minimum.at(vmin, inverse, values)
+  numpy.maximum.at(vmax, inverse, values)
+
+  if kind == 'hex':
+    center_x, center_y = hex_bin_centers(unique_keys[:, 0], unique_keys[:, 1], size)
+  else:
+    center_x, center_y = square_bin_centers(unique_keys[:, 0], unique_keys[:, 1], size)
+
+  return pandas.DataFrame({
+    'key_0': unique_keys[:, 0],
+    'key_1': unique_keys[:, 1],
+    'x': center_x,
+    'y': center_y,
+    'count': count,
+    'mean': mean,
+    'min': vmin,
+    'max': vmax,
+  })
+
+def get_bin_size_m(zoom, bin_px):
+  """Bin size in web mercator meters that spans about `bin_px` pixels at `zoom`"""
+  return climatefind.tiles.meters_per_pixel(zoom) * bin_px
+
+def bin_pyramid(df, min_zoom, max_zoom, bin_px, kind='hex'):
+  """
+  Bin the summary `df` (`lon`, `lat`, `elev`) once per zoom level, with the
+  bins halving in size at every level.
+
+  :return: Dict of zoom to (bin size in meters, bins DataFrame)
+  """
+  x, y = climatefind.tiles.lonlat_to_mercator(df['lon'].to_numpy(), df['lat'].to_numpy())
+  values = df['elev'].to_numpy()
+  pyramid = {}
+  for zoom in range(min_zoom, max_zoom):
+    size = get_bin_size_m(zoom, bin_px)
+    pyramid[zoom] = (size, bin_values(x, y, values, size, kind))
+  return pyramid
+
+def bins_to_geojson(bins, size, kind, colors, vmin, vmax, units=''):
+  """
+  :return: GeoJSON FeatureCollection of the bin polygons in lon/lat
+  """
+  x = bins['x'].to_numpy()
+  y = bins['y'].to_numpy()
+  if kind == 'hex':
+    ring_x, ring_y = hex_corners(x, y, size)
+  else:
+    ring_x, ring_y = square_corners(x, y, size)
+  ring_lon, ring_lat = climatefind.tiles.mercator_to_lonlat(ring_x, ring_y)
+  features = []
+  for i, (count, mean, bin_min, bin_max) in enumerate(zip(bins['count'], bins['mean'], bins['min'], bins['max'])):
+    color = climatefind.scale_onto_array(vmin=vmin, vmax=vmax, val=mean, arr=colors)
+    features.append({
+      'type': 'Feature',
+      'geometry': {
+        'type': 'Polygon',
+        'coordinates': [numpy.column_stack([ring_lon[i], ring_lat[i]]).round(5).tolist()],
+      },
+      'properties': {
+        'count': int(count),
+        'mean': round(float(mean), 2),
+        'min': round(float(bin_min), 2),
+        'max': round(float(bin_max), 2),
+        'color': color,
+        'tooltip': f'{int(count)} stations: mean {round(float(mean), 2)} (min {round(float(bin_min), 2)}, max {round(float(bin_max), 2)}) {units}',
+      },
+    })
+  return {
+    'type': 'FeatureCollection',
+    'features': features,
+  }
+
+def add_bin_layers(geomap, df, colors, vmin, vmax, units=''):
+  """
+  Add one layer of binned stations per zoom level below
+  `binning.station_zoom` to `geomap`.
+
+  :return: List of (layer, min_zoom, max_zoom) tuples for ZoomLayerToggle
+  """
+  env = MAIN.ENV['binning']
+  layers = []
+  pyramid = bin_pyramid(df, env['min_zoom'], env['station_zoom'], env['bin_px'], env['kind'])
+  for zoom, (size, bins) in pyramid.items():
+    layer = folium.GeoJson(
+      bins_to_geojson(bins, size, env['kind'], colors, vmin, vmax, units),
+      name=f'bins_z{zoom}',
+      style_function=lambda x: {
+        'color':       x['properties']['color'],
+        'weight':      1,
+        'fillColor':   x['properties']['color'],
+        'opacity':     0.9,
+        'fillOpacity': 0.7,
+      },
+      tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+    )
+    layer.add_to(geomap)
+    min_zoom = 0 if zoom == env['min_zoom'] else zoom
+    layers.append((layer, min_zoom, zoom + 1))
+  return layers
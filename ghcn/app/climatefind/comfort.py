@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""
+The Pierce two-node Standard Effective Temperature (SET) model, vectorized
+with NumPy for every synthesized hour of a station at once.
+
+This is the TMY3 pipeline's `comfPierceSETArray` (tmy3/comfort_models, after
+the CBE Comfort Tool), copied here so this package doesn't depend on code
+outside it. Keep the two in step: test_pierce_set_matches_tmy3 checks they
+give identical results on random conditions.
+"""
+
+# Contrib
+import numpy
+
+def saturated_vapor_pressure_torr(t):
+  """
+  :return: Saturated vapor pressure (Torr) of air at `t` (C)
+  """
+  return numpy.exp(18.6686 - 4030.183 / (t + 235.0))
+
+def pierce_set(ta, tr, vel, rh, met, clo, wme, max_iter=100):
+  """
+  SET of every element of the (broadcast) inputs. Every element runs the
+  same 60 simulated minutes, and the SET Newton solve stops per element
+  once it converges.
+
+  :param ta: Air temperature (C)
+  :param tr: Mean radiant temperature (C)
+  :param vel: Air speed (m/s)
+  :param rh: Relative humidity (%)
+  :param met: Metabolic rate (met)
+  :param clo: Clothing insulation (clo)
+  :param wme: External work (met)
+  :param max_iter: Cap on the Newton iterations for SET
+  :return: SET (C) in the broadcast shape of the inputs (a float for scalar
+    inputs), NaN where the model fails or doesn't converge
+  """
+  ta, tr, vel, rh, met, clo, wme = numpy.broadcast_arrays(
+    *[numpy.asarray(x, dtype=numpy.float64) for x in (ta, tr, vel, rh, met, clo, wme)])
+  shape = ta.shape
+  ta, tr, vel, rh, met, clo, wme = [x.ravel() for x in (ta, tr, vel, rh, met, clo, wme)]
+
+  with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+    # Key initial variables
+    vapor_pressure = (rh * saturated_vapor_pressure_torr(ta)) / 100
+    air_velocity = numpy.maximum(vel, 0.1)
+    KCLO = 0.25
+    BODY_WEIGHT = 69.9
+    BODY_SURFACE_AREA = 1.8258
+    MET_FACTOR = 58.2
+    CSW = 170
+    CDIL = 120
+    CSTR = 0.5
+
+    TEMP_SKIN_NEUTRAL = 33.7
+    TEMP_CORE_NEUTRAL = 36.49
+    TEMP_BODY_NEUTRAL = 36.49
+    SKIN_BLOOD_FLOW_NEUTRAL = 6.3
+
+    temp_skin = numpy.full(ta.shape, TEMP_SKIN_NEUTRAL)
+    temp_core = numpy.full(ta.shape, TEMP_CORE_NEUTRAL)
+    skin_blood_flow = numpy.full(ta.shape, SKIN_BLOOD_FLOW_NEUTRAL)
+    alfa = numpy.full(ta.shape, 0.1)
+    esk = 0.1 * met
+
+    pressure_in_atmospheres = 101325.0 / 1000 * 0.009869
+    rcl = 0.155 * clo
+
+    facl = 1.0 + 0.15 * clo
+    lr = 2.2 / pressure_in_atmospheres
+    rm = met * MET_FACTOR
+    m = met * MET_FACTOR
+
+    wcrit = numpy.where(clo <= 0, 0.38 * numpy.power(air_velocity, -0.29), 0.59 * numpy.power(air_velocity, -0.08))
+    icl = numpy.where(clo <= 0, 1.0, 0.45)
+
+    chc = numpy.maximum(3.0 * pow(pressure_in_atmospheres, 0.53), 8.600001 * numpy.power((air_velocity * pressure_in_atmospheres), 0.53))
+
+    # Tcl is only estimated once, like the CBE Comfort Tool's SET
+    CHR = 4.7
+    ctc = CHR + chc
+    ra = 1.0 / (facl * ctc)
+    top = (CHR * tr + chc * ta) / ctc
+
+    rea = 1.0 / (lr * facl * chc)
+    recl = rcl / (lr * icl)
+    failed = numpy.zeros(ta.shape, dtype=bool)
+
+    for minute in range(60):
+      dry = (temp_skin - top) / (ra + rcl)
+      hfcs = (temp_core - temp_skin) * (5.28 + 1.163 * skin_blood_flow)
+      eres = 0.0023 * m * (44.0 - vapor_pressure)
+      cres = 0.0014 * m * (34.0 - ta)
+      scr = m - hfcs - eres - cres - wme
+      ssk = hfcs - dry - esk
+      tcsk = 0.97 * alfa * BODY_WEIGHT
+      tccr = 0.97 * (1 - alfa) * BODY_WEIGHT
+      dtsk = (ssk * BODY_SURFACE_AREA) / (tcsk * 60.0)
+      dtcr = scr * BODY_SURFACE_AREA / (tccr * 60.0)
+      temp_skin = temp_skin + dtsk
+      temp_core = temp_core + dtcr
+      tb = alfa * temp_skin + (1 - alfa) * temp_core
+      sksig = temp_skin - TEMP_SKIN_NEUTRAL
+      warms = (sksig > 0) * sksig
+      colds = ((-1.0 * sksig) > 0) * (-1.0 * sksig)
+      crsig = (temp_core - TEMP_CORE_NEUTRAL)
+      warmc = (crsig > 0) * crsig
+      coldc = ((-1.0 * crsig) > 0) * (-1.0 * crsig)
+      bdsig = tb - TEMP_BODY_NEUTRAL
+      warmb = (bdsig > 0) * bdsig
+      skin_blood_flow = numpy.clip((SKIN_BLOOD_FLOW_NEUTRAL + CDIL * warmc) / (1 + CSTR * colds), 0.5, 90.0)
+
+      regsw = numpy.minimum(CSW * warmb * numpy.exp(warms / 10.7), 500.0)
+      ersw = 0.68 * regsw
+      emax = (saturated_vapor_pressure_torr(temp_skin) - vapor_pressure) / (rea + recl)
+      failed |= (emax == 0)
+      prsw = ersw / emax
+      pwet = 0.06 + 0.94 * prsw
+      edif = pwet * emax - ersw
+
+      too_wet = pwet > wcrit
+      pwet = numpy.where(too_wet, wcrit, pwet)
+      prsw = numpy.where(too_wet, wcrit / 0.94, prsw)
+      ersw = numpy.where(too_wet, prsw * emax, ersw)
+      edif = numpy.where(too_wet, 0.06 * (1.0 - prsw) * emax, edif)
+
+      no_evap = emax < 0
+      edif = numpy.where(no_evap, 0, edif)
+      ersw = numpy.where(no_evap, 0, ersw)
+      pwet = numpy.where(no_evap, wcrit, pwet)
+      esk = ersw + edif
+      m = rm + 19.4 * colds * coldc
+      alfa = 0.0417737 + 0.7451833 / (skin_blood_flow + .585417)
+
+    hsk = dry + esk
+    w = pwet
+    pssk = saturated_vapor_pressure_torr(temp_skin)
+    # The ASHRAE standard environment
+    chcs = numpy.where(met < 0.85, 3.0, numpy.maximum(5.66 * numpy.power((met - 0.85), 0.39), 3.0))
+
+    ctcs = chcs + CHR
+    rclos = 1.52 / ((met - wme / MET_FACTOR) + 0.6944) - 0.1835
+    rcls = 0.155 * rclos
+    facls = 1.0 + KCLO * rclos
+    fcls = 1.0 / (1.0 + 0.155 * facls * ctcs * rclos)
+    ims = 0.45
+    icls = ims * chcs / ctcs * (1 - fcls) / (chcs / ctcs - fcls * ims)
+    ras = 1.0 / (facls * ctcs)
+    reas = 1.0 / (lr * facls * chcs)
+    recls = rcls / (lr * icls)
+    hd_s = 1.0 / (ras + rcls)
+    he_s = 1.0 / (reas + recls)
+
+    # SET by Newton's method, only stepping the elements that haven't converged yet
+    delta = .0001
+    x = temp_skin - hsk / hd_s  # Lower bound for SET
+    active = ~failed
+    for i in range(max_iter):
+      if not active.any():
+        break
+      x_old = x[active]
+      err1 = (hsk[active] - hd_s[active] * (temp_skin[active] - x_old) - w[active] * he_s[active]
+        * (pssk[active] - 0.5 * saturated_vapor_pressure_torr(x_old)))
+      err2 = (hsk[active] - hd_s[active] * (temp_skin[active] - (x_old + delta)) - w[active] * he_s[active]
+        * (pssk[active] - 0.5 * saturated_vapor_pressure_torr(x_old + delta)))
+      flat = (err2 - err1) == 0
+      x_new = numpy.where(flat, x_old, x_old - delta * err1 / (err2 - err1))
+      x[active] = x_new
+      active[active] = ~flat & (numpy.abs(x_new - x_old) > .01)
+    x[active | failed] = numpy.nan
+
+  return x.reshape(shape)[()]
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Core
+import argparse
+import concurrent.futures
+import json
+import os
+import timeit
+
+# Contrib
+import numpy
+import numpy.lib.format
+import scipy.interpolate
+import scipy.ndimage
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+# Set in each worker by init_worker
+INTERPOLATOR = None
+
+def get_halo_px(sigma, truncate=4.0):
+  """
+  :return: Per axis radius of the Gaussian kernel `scipy.ndimage.gaussian_filter` uses
+  """
+  return tuple(int(truncate * float(s) + 0.5) for s in sigma)
+
+def get_grid_tiles(shape, tile_px):
+  """
+  Split a `shape` array into `tile_px` square tiles (smaller at the far edges).
+
+  :return: List of (row_start, row_stop, col_start, col_stop)
+  """
+  rows, cols = shape
+  return [
+    (row_start, min(row_start + tile_px, rows), col_start, min(col_start + tile_px, cols))
+    for row_start in range(0, rows, tile_px)
+    for col_start in range(0, cols, tile_px)
+  ]
+
+def get_grid_axes(df, num_points):
+  """
+  :return: x_arr, y_arr of the same mesh `grid_summary_df` uses
+  """
+  x = df['lon'].to_numpy(dtype=numpy.float64)
+  y = df['lat'].to_numpy(dtype=numpy.float64)
+  return (
+    numpy.linspace(numpy.min(x), numpy.max(x), num_points),
+    numpy.linspace(numpy.min(y), numpy.max(y), num_points),
+  )
+
+def init_worker(points, values):
+  global INTERPOLATOR
+  # Same linear interpolation `scipy.interpolate.griddata` does, triangulated
+  # once per worker instead of once per tile
+  INTERPOLATOR = scipy.interpolate.LinearNDInterpolator(points, values)
+
+def grid_tile(grid_filepath, tile, x_arr, y_arr, sigma, halo):
+  """
+  Interpolate and smooth one tile plus its halo, then write the tile (without
+  the halo) into the on-disk grid. The halo is as wide as the Gaussian kernel,
+  so the tile comes out the same as smoothing the whole grid at once.
+  """
+  row_start, row_stop, col_start, col_stop = tile
+  halo_rows, halo_cols = halo
+  window_row_start = max(row_start - halo_rows, 0)
+  window_row_stop = min(row_stop + halo_rows, len(y_arr))
+  window_col_start = max(col_start - halo_cols, 0)
+  window_col_stop = min(col_stop + halo_cols, len(x_arr))
+
+  x_mesh, y_mesh = numpy.meshgrid(
+    x_arr[window_col_start:window_col_stop],
+    y_arr[window_row_start:window_row_stop],
+  )
+  z_window = INTERPOLATOR(x_mesh, y_mesh)
+  # Past the edges of the whole grid the constant mode pads with 0 just like
+  # it does for the whole grid
+  z_window = scipy.ndimage.gaussian_filter(z_window, list(sigma), mode='constant')
+
+  z_mesh = numpy.lib.format.open_memmap(grid_filepath, mode='r+')
+  z_mesh[row_start:row_stop, col_start:col_stop] = z_window[
+    row_start - window_row_start:row_stop - window_row_start,
+    col_start - window_col_start:col_stop - window_col_start,
+  ]
+  z_mesh.flush()
+  del z_mesh
+  return tile
+
+def get_grid_filepath(column):
+  return f'{MAIN.GHCN_DIR}/spool/grid/{column}.npy'
+
+def grid_summary_tiled(df, grid_filepath, num_points=None, sigma=None, tile_px=None, workers=None):
+  """
+  Grid the station values in `df` (`lon`, `lat`, `elev`) like
+  `grid_summary_df`, one tile at a time in a process pool, straight into an
+  on-disk `.npy` array so the resolution isn't limited by memory.
+
+  :return: x_arr, y_arr, z_mesh (read-only memmap of shape (len(y_arr), len(x_arr)))
+  """
+  env = MAIN.ENV['grid']
+  num_points = num_points or env['num_points']
+  sigma = tuple(sigma or env['sigma'])
+  tile_px = tile_px or env['tile_px']
+  workers = workers or env['workers'] or os.cpu_count()
+  start_time = timeit.default_timer()
+
+  points = numpy.column_stack([
+    df['lon'].to_numpy(dtype=numpy.float64),
+    df['lat'].to_numpy(dtype=numpy.float64),
+  ])
+  values = df['elev'].to_numpy(dtype=numpy.float64)
+  x_arr, y_arr = get_grid_axes(df, num_points)
+  shape = (len(y_arr), len(x_arr))
+  halo = get_halo_px(sigma)
+  tiles = get_grid_tiles(shape, tile_px)
+
+  os.makedirs(os.path.dirname(grid_filepath), exist_ok=True)
+  z_mesh = numpy.lib.format.open_memmap(grid_filepath, mode='w+', dtype=numpy.float64, shape=shape)
+  del z_mesh
+  with open(f'{os.path.splitext(grid_filepath)[0]}.json', 'w') as f:
+    json.dump({
+      'x_min': x_arr[0],
+      'x_max': x_arr[-1],
+      'y_min': y_arr[0],
+      'y_max': y_arr[-1],
+      'shape': shape,
+      'sigma': sigma,
+    }, f, indent=2)
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(points, values)) as executor:
+    futures = [
+      executor.submit(grid_tile, grid_filepath, tile, x_arr, y_arr, sigma, halo)
+      for tile in tiles
+    ]
+    for future in concurrent.futures.as_completed(futures):
+      future.result()
+
+  MAIN.LOG.info(f'Gridded {shape[0]}x{shape[1]} in {len(tiles)} tiles to {grid_filepath} in {round((timeit.default_timer() - start_time), 1)}s')
+  return x_arr, y_arr, numpy.load(grid_filepath, mmap_mode='r')
+
+def load_grid(grid_filepath):
+  """
+  :return: x_arr, y_arr, z_mesh (read-only memmap) of a grid written by `grid_summary_tiled`
+  """
+  with open(f'{os.path.splitext(grid_filepath)[0]}.json') as f:
+    meta = json.load(f)
+  rows, cols = meta['shape']
+  return (
+    numpy.linspace(meta['x_min'], meta['x_max'], cols),
+    numpy.linspace(meta['y_min'], meta['y_max'], rows),
+    numpy.load(grid_filepath, mmap_mode='r'),
+  )
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--column', dest='column', default='average_comfy_days', required=False)
+  parser.add_argument('--num-points', dest='num_points', type=int, default=None, required=False)
+  parser.add_argument('--tile-px', dest='tile_px', type=int, default=None, required=False)
+  parser.add_argument('--workers', dest='workers', type=int, default=None, required=False)
+  args = parser.parse_args()
+
+  climatefind.read_env()
+  climatefind.setup_logger()
+
+  df = climatefind.get_elevation_df_from_summary_csv(args.column)
+  grid_summary_tiled(
+    df,
+    get_grid_filepath(args.column),
+    num_points=args.num_points,
+    tile_px=args.tile_px,
+    workers=args.workers,
+  )
+
+if __name__ == "__main__":
+    main()
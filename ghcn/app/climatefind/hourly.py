@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Core
+import argparse
+import concurrent.futures
+import json
+import os
+import pathlib
+import timeit
+
+# Contrib
+import numpy
+import pandas
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+def synthesize_hours(tmax, tmin, tmin_hour, tmax_hour):
+  """
+  Hourly air temperature from each day's TMAX/TMIN: a half cosine rising
+  from TMIN at `tmin_hour` to TMAX at `tmax_hour`, and another falling back
+  to TMIN at `tmin_hour` over the rest of the day.
+
+  :param tmax: (days,) C
+  :param tmin: (days,) C
+  :return: (days, 24) C, hour 0 first
+  """
+  hours_since_tmin = (numpy.arange(24) - tmin_hour) % 24
+  rise_hours = (tmax_hour - tmin_hour) % 24
+  warmth = numpy.where(
+    hours_since_tmin <= rise_hours,
+    (1 - numpy.cos(numpy.pi * hours_since_tmin / rise_hours)) / 2,
+    (1 + numpy.cos(numpy.pi * (hours_since_tmin - rise_hours) / (24 - rise_hours))) / 2,
+  )
+  return tmin[:, numpy.newaxis] + (tmax - tmin)[:, numpy.newaxis] * warmth
+
+def relative_humidity(ta, dew_point):
+  """
+  :return: Relative humidity (%) of air at `ta` (C) with a dew point of
+    `dew_point` (C), by the SET model's saturation vapor pressure so the
+    model sees the dew point's vapor pressure exactly
+  """
+  dew_point = numpy.minimum(dew_point, ta)
+  return 100 * numpy.exp(4030.183 / (ta + 235.0) - 4030.183 / (dew_point + 235.0))
+
+def get_comfy_hours(tmax, tmin, env=None):
+  """
+  Whether each synthesized hour is comfy: in the `hourly` window, with a
+  dew point (taken as TMIN) no higher than `max_dew_point`, and with the
+  desired SET between the SET dressed cool walking slow and dressed warm
+  walking fast, like the TMY3 pipeline's SET model.
+
+  :param env: The `hourly` section of env.yml (default: `MAIN.ENV['hourly']`)
+  :return: (days, 24) boolean
+  """
+  env = env or MAIN.ENV['hourly']
+  ta = synthesize_hours(tmax, tmin, env['tmin_hour'], env['tmax_hour'])
+  dew_point = numpy.broadcast_to((tmin + env['dew_point_offset'])[:, numpy.newaxis], ta.shape)
+  hour = numpy.broadcast_to(numpy.arange(24), ta.shape)
+
+  comfy = numpy.zeros(ta.size, dtype=bool)
+  index = numpy.flatnonzero(
+    (env['earliest_hour'] <= hour) & (hour <= env['latest_hour']) & (dew_point <= env['max_dew_point'])
+  )
+  ta = ta.ravel()[index]
+  rh = relative_humidity(ta, dew_point.ravel()[index])
+
+  # Only hours that aren't too warm dressed cool can be comfy, so only they need the second SET
+  how_you_would_feel_dressed_cool_walking_slow = climatefind.comfort.pierce_set(
+    ta, ta, env['wind_speed'], rh, env['min_metabolic_rate'], env['min_clothing_rating'], 0)
+  keep = how_you_would_feel_dressed_cool_walking_slow <= env['desired_set']
+  index, ta, rh = index[keep], ta[keep], rh[keep]
+  how_you_would_feel_dressed_warm_walking_fast = climatefind.comfort.pierce_set(
+    ta, ta, env['wind_speed'], rh, env['max_metabolic_rate'], env['max_clothing_rating'], 0)
+  comfy[index] = env['desired_set'] <= how_you_would_feel_dressed_warm_walking_fast
+  return comfy.reshape(hour.shape)
+
+def hourly_station(filename):
+  """
+  :return: Dict with the station's meta and its comfy days by hourly SET
+  """
+  with open(f'{MAIN.GHCN_DIR}/spool/meta/{filename}') as f:
+    meta = json.load(f)
+  day_index, tmax, tmin = climatefind.sweep.read_station_days(f'input/queue/{filename}')
+  comfy_hours = get_comfy_hours(tmax, tmin)
+  comfy_days = comfy_hours.sum(axis=1) >= MAIN.ENV['hourly']['min_comfy_hours']
+  total_comfy_days, average_comfy_days = climatefind.sweep.summarize_comfy_days(day_index, comfy_days[numpy.newaxis])
+  return {
+    'id': meta['id'],
+    'state': meta['state'],
+    'lat': meta['lat'],
+    'lon': meta['lon'],
+    'elev_m': meta['elev_m'],
+    'total_comfy_days': int(total_comfy_days[0]),
+    'average_comfy_days': float(average_comfy_days[0]),
+    'mean_comfy_hours': round(float(comfy_hours.sum(axis=1).mean()), 2),
+  }
+
+def run_hourly(workers=None):
+  """
+  Count comfy days by the hourly SET model for every qualifying
+  (`spool/meta/`) station, and write `spool/hourly/stations.csv`.
+
+  :return: DataFrame with one row per station (None if there are no stations)
+  """
+  workers = workers or MAIN.ENV['hourly']['workers'] or os.cpu_count()
+  start_time = timeit.default_timer()
+  filenames = sorted(
+    os.path.basename(file)
+    for file in pathlib.Path(os.path.join(MAIN.GHCN_DIR, 'spool', 'meta')).glob(MAIN.ENV['input']['file_glob'])
+  )
+
+  if not filenames:
+    MAIN.LOG.warning('No qualifying stations in spool/meta/ to evaluate')
+    return None
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=climatefind.init_worker, initargs=(MAIN.ENV,)) as executor:
+    stations = pandas.DataFrame(executor.map(hourly_station, filenames))
+
+  hourly_dir = f'{MAIN.GHCN_DIR}/spool/hourly'
+  os.makedirs(hourly_dir, exist_ok=True)
+  stations.to_csv(f'{hourly_dir}/stations.csv', index=False)
+  MAIN.LOG.info(f'Evaluated hourly SET for {len(filenames)} stations in {round((timeit.default_timer() - start_time), 1)}s')
+  return stations
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--workers', dest='workers', type=int, default=None, required=False)
+  args = parser.parse_args()
+
+  climatefind.read_env()
+  climatefind.setup_logger()
+  climatefind.setup_spool()
+  run_hourly(workers=args.workers)
+
+if __name__ == "__main__":
+    main()
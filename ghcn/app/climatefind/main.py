@@ -39,6 +39,10 @@ import climatefind
 ENV: typing.Dict[typing.Any, typing.Any] = {}
 LOG: logging.Logger
 
+# The package re-exports main() over the `climatefind.main` name, so the other
+# modules import this handle (`from climatefind.main import MAIN`) for ENV and LOG
+MAIN = sys.modules[__name__]
+
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 THIS_PARENT_DIR = os.path.dirname(THIS_DIR)
 GHCN_DIR = os.path.dirname(THIS_PARENT_DIR)
@@ -151,6 +155,10 @@ CALENDAR = {
 for month, meta in CALENDAR.items():
   CALENDAR[month]['days'] = [ i for i in range(1, (CALENDAR[month]['num_days'] + 1)) ]
 
+# Month of each day of a 365 day year, and the 0-based day each month starts on
+MONTH_OF_DAY = numpy.repeat(list(CALENDAR), [CALENDAR[month]['num_days'] for month in CALENDAR])
+DAYS_BEFORE_MONTH = numpy.cumsum([0] + [CALENDAR[month]['num_days'] for month in CALENDAR])[:-1]
+
 MAP_COLORS = {
   'high_red': [
     '#00FFFF',
@@ -276,6 +284,12 @@ def setup_logger() -> None:
   LOG.addHandler(console_handler)
   LOG.info(f'''Logging enabled at {ENV['log']['level']} ({log_level}) level.''')
 
+def init_worker(env):
+  """Process pool initializer: use the parent's env and log like it"""
+  global ENV
+  ENV = env
+  setup_logger()
+
 def setup_spool():
   dirs = [
     f'{GHCN_DIR}/spool',
@@ -347,6 +361,40 @@ def check_all_files(hash_start='*', overwrite=False, write_meta=False, spool=Non
   LOG.info(f'Found {num_qualifying_files} qualifying files')
   return num_qualifying_files
 
+def get_year_summary_row(year):
+  """
+  :param year: A spooled year (as written to `spool/year/`, with string month and day keys)
+  :return: The station's row of `spool/comfy/year.csv`
+  """
+  row = {
+    'id': year['meta']['id'],
+    'state': year['meta']['state'],
+    'start_date': year['meta']['start_date'],
+    'end_date': year['meta']['end_date'],
+    'lat': year['meta']['lat'],
+    'lon': year['meta']['lon'],
+    'elev_m': year['meta']['elev_m'],
+    'total_comfy_days': year['total_comfy_days'],
+    'average_comfy_days': year['average_comfy_days'],
+    'aug_1_tmin': year["8"]['comfy_days']["1"]['tmin_mean'],
+    'aug_1_tmax': year["8"]['comfy_days']["1"]['tmax_mean'],
+    'name': year['meta']['name'],
+  }
+  for month_num in CALENDAR:
+    row[f'''{CALENDAR[month_num]['name']}_percent_comfy'''] = round(
+      (
+        (
+          sum(
+            [
+              (day['comfy'] / (day['uncomfy'] + day['comfy'] ))
+              for day_num, day in year[str(month_num)]['comfy_days'].items()
+            ]
+          ) / CALENDAR[month_num]['num_days']
+        ) * 100 # Convert to percent
+      ), 2
+    )
+  return row
+
 def spool_year_summary_csv(overwrite=False, spool=None):
   queue = pathlib.Path(os.path.join(GHCN_DIR, 'spool', 'year')).glob(ENV['input']['file_glob'])
   if overwrite:
@@ -365,34 +413,7 @@ def spool_year_summary_csv(overwrite=False, spool=None):
     if file_num % 100 == 0:
       LOG.info(f'Loading file {file_num}')
     with open(file.resolve()) as f:
-      year = json.load(f)
-      comfy[file_num] = {
-        'id': year['meta']['id'],
-        'state': year['meta']['state'],
-        'start_date': year['meta']['start_date'],
-        'end_date': year['meta']['end_date'],
-        'lat': year['meta']['lat'],
-        'lon': year['meta']['lon'],
-        'elev_m': year['meta']['elev_m'],
-        'total_comfy_days': year['total_comfy_days'],
-        'average_comfy_days': year['average_comfy_days'],
-        'aug_1_tmin': year["8"]['comfy_days']["1"]['tmin_mean'],
-        'aug_1_tmax': year["8"]['comfy_days']["1"]['tmax_mean'],
-        'name': year['meta']['name'],
-      }
-      for month_num in CALENDAR:
-        comfy[file_num][f'''{CALENDAR[month_num]['name']}_percent_comfy'''] = round(
-          (
-            (
-              sum(
-                [
-                  (day['comfy'] / (day['uncomfy'] + day['comfy'] ))
-                  for day_num, day in year[str(month_num)]['comfy_days'].items()
-                ]
-              ) / CALENDAR[month_num]['num_days']
-            ) * 100 # Convert to percent
-          ), 2
-        )
+      comfy[file_num] = get_year_summary_row(json.load(f))
 
   comfy_df = pandas.DataFrame.from_dict(comfy, orient="index")
   comfy_df.sort_values(['state', 'average_comfy_days'], inplace=True)
@@ -447,46 +468,41 @@ def spool_tmax_tmin(hash_start='*', overwrite=False, spool=None):
       LOG.info(f'Wrote tmin and tmax for {filename} in {round((timeit.default_timer() - start_time), 1)}s')
 
 def num_comfy_days_per_year_from_csv(csv):
+  """
+  Count each calendar day's comfy and uncomfy years by the env's `comfy` rule
+  (see `climatefind.rules`), evaluated over the whole station at once. Only
+  days with both TMAX and TMIN are counted.
+  """
+  evaluate, columns = climatefind.rules.compile_rule(climatefind.rules.get_rule(ENV['comfy']))
+  day_index = get_day_of_year_index(csv['DATE'])
+  tmax = csv['TMAX'].to_numpy(dtype=numpy.float64)
+  tmin = csv['TMIN'].to_numpy(dtype=numpy.float64)
+  keep = (day_index >= 0) & ~numpy.isnan(tmax) & ~numpy.isnan(tmin)
+  comfy = evaluate(climatefind.rules.get_columns(csv[keep], columns))
+
+  # Group the days by calendar day, keeping file order within each
+  day_index = day_index[keep]
+  order = numpy.argsort(day_index, kind='stable')
+  day_starts = numpy.searchsorted(day_index[order], numpy.arange(1, 365))
+  tmaxs = numpy.split(normalize_temperature(tmax[keep][order]), day_starts)
+  tmins = numpy.split(normalize_temperature(tmin[keep][order]), day_starts)
+  num_comfy = numpy.bincount(day_index[comfy], minlength=365)
+  num_days = numpy.bincount(day_index, minlength=365)
+
   year = copy.deepcopy(CALENDAR)
   for month_num, month in year.items():
     year[month_num]['comfy_days'] = {}
     for day in year[month_num]['days']:
+      i = DAYS_BEFORE_MONTH[month_num - 1] + day - 1
       year[month_num]['comfy_days'][day] = {
-        'comfy': 0,
-        'uncomfy': 0,
-        'tmax': [],
-        'tmin': [],
+        'comfy': int(num_comfy[i]),
+        'uncomfy': int(num_days[i] - num_comfy[i]),
+        'tmax': tmaxs[i].tolist(),
+        'tmin': tmins[i].tolist(),
+        'tmax_mean': round(statistics.mean(tmaxs[i].tolist()), 2),
+        'tmin_mean': round(statistics.mean(tmins[i].tolist()), 2),
       }
 
-  for index, row in csv.iterrows():
-    date = get_date_dict(row['DATE'])
-    year_found = date['year']
-    month_found = date['month']
-    day_found = date['day']
-    if month_found == 2 and day_found == 29:  # Simply ignore Feb 29
-      continue
-    tmax_found = row['TMAX']
-    tmin_found = row['TMIN']
-    try:
-      normalized_tmax = normalize_temperature(int(tmax_found))
-      normalized_tmin = normalize_temperature(int(tmin_found))
-      year[month_found]['comfy_days'][day_found]['tmax'].append(normalized_tmax)
-      year[month_found]['comfy_days'][day_found]['tmin'].append(normalized_tmin)
-      if is_comfy_day(
-        tmax=normalize_temperature(tmax_found),
-        tmin=normalize_temperature(tmin_found)
-      ):
-        year[month_found]['comfy_days'][day_found]['comfy'] += 1
-      else:
-        year[month_found]['comfy_days'][day_found]['uncomfy'] += 1
-    except ValueError:
-      continue
-
-  for month, meta in year.items():
-    for day in year[month]['days']:
-      year[month]['comfy_days'][day]['tmax_mean'] = round(statistics.mean(year[month]['comfy_days'][day]['tmax']), 2)
-      year[month]['comfy_days'][day]['tmin_mean'] = round(statistics.mean(year[month]['comfy_days'][day]['tmin']), 2)
-
   year = summarize_year(year)
 
   return year
@@ -521,14 +537,25 @@ def summarize_month(month):
     'average_comfy_days': round(average_comfy_days, 2),
   }
 
-def is_comfy_day(tmax, tmin):
+def is_comfy_day(tmax, tmin, tmax_solo_min=None, tmax_solo_max=None, tmin_if_tmax_above_max=None):
+  """
+  Element-wise over arrays too. The thresholds default to env.yml's `comfy`
+  settings and broadcast against `tmax` and `tmin`, e.g. a column of them
+  against a row of days.
+  """
+  if tmax_solo_min is None:
+    tmax_solo_min = ENV['comfy']['tmax_solo']['min']
+  if tmax_solo_max is None:
+    tmax_solo_max = ENV['comfy']['tmax_solo']['max']
+  if tmin_if_tmax_above_max is None:
+    tmin_if_tmax_above_max = ENV['comfy']['tmin_if_tmax_above_max']
   return (
     (
-      ENV['comfy']['tmax_solo']['min'] <= tmax <= ENV['comfy']['tmax_solo']['max']
-    ) or (
-      tmax > ENV['comfy']['tmax_solo']['max']
-      and
-      tmin <= ENV['comfy']['tmin_if_tmax_above_max']
+      (tmax_solo_min <= tmax) & (tmax <= tmax_solo_max)
+    ) | (
+      (tmax > tmax_solo_max)
+      &
+      (tmin <= tmin_if_tmax_above_max)
     )
   )
 
@@ -648,19 +675,36 @@ def get_date_dict(date_string):
     'day': int(date_string[8:10]),
   }
 
+def get_day_of_year_index(dates):
+  """
+  Vectorized `get_date_dict` for a whole column of dates.
+
+  :param dates: Series of `YYYY-MM-DD` strings
+  :return: 0-based day of a 365 day year for each date (-1 for Feb 29, which is ignored)
+  """
+  month = dates.str.slice(5, 7).astype(int).to_numpy()
+  day = dates.str.slice(8, 10).astype(int).to_numpy()
+  day_index = DAYS_BEFORE_MONTH[month - 1] + day - 1
+  day_index[(month == 2) & (day == 29)] = -1
+  return day_index
+
 def csv_from_temp_ghcn_file(filepath):
+  """Read a temperature file, with any other columns the `comfy` rule compares"""
+  rule_columns = climatefind.rules.compile_rule(climatefind.rules.get_rule(ENV['comfy']))[1]
+  usecols = [
+    'STATION',
+    'DATE',
+    'LATITUDE',
+    'LONGITUDE',
+    'ELEVATION',
+    'NAME',
+    'TMAX',
+    'TMIN',
+  ]
   return pandas.read_csv(
     f'{GHCN_DIR}/{filepath}',
-    usecols=[
-      'STATION',
-      'DATE',
-      'LATITUDE',
-      'LONGITUDE',
-      'ELEVATION',
-      'NAME',
-      'TMAX',
-      'TMIN',
-    ]
+    # A file without one of the rule's columns is read without it
+    usecols=lambda column: column in usecols or column in rule_columns,
   )
 
 
@@ -711,6 +755,9 @@ def scale_onto_array(vmin, vmax, val, arr):
 def get_elevation_df_from_summary_csv(elevation_column='elev_m', no_negatives=True):
   """
   Elevation may or may not be an actual elevation.
+
+  The columns come from the process-wide cached summary, so repeated calls
+  don't re-read `spool/comfy/year.csv` unless it changed.
   """
   usecols=[
     'lat',
@@ -722,43 +769,29 @@ def get_elevation_df_from_summary_csv(elevation_column='elev_m', no_negatives=Tr
   if elevation_column != 'elev_m':
     usecols += ['elev_m']
 
-  df = pandas.read_csv(
-    f'{GHCN_DIR}/spool/comfy/year.csv',
-    usecols=usecols
-  )
-  df.rename(columns={elevation_column: 'elev'}, inplace=True)
+  df = climatefind.summary.get_year_summary().columns(usecols)
+  df = df.rename(columns={elevation_column: 'elev'})
+  if elevation_column == 'elev_m':
+    df['elev_m'] = df['elev']
   if no_negatives:
-    df[df['elev'] < 0] = 0
-    return df
-  else:
-    return df
-
-def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_green', units='m'):
-  df = get_elevation_df_from_summary_csv(elevation_column)
-  colors = MAP_COLORS[color_scheme]
-  num_colors = len(colors)
+    df['elev'] = df['elev'].clip(lower=0)
+  return df
 
-  # Setup minimum and maximum values for the contour lines
-  elevation_min = df['elev'].min()
-  elevation_max = df['elev'].max()
-
-  # Setup colormap
-  color_map = branca.colormap.LinearColormap(
-    colors,
-    vmin=elevation_min,
-    vmax=elevation_max
-  ).to_step(
-    num_colors
-  )
+def grid_summary_df(df, num_points=500, sigma=(1, 1)):
+  """
+  Interpolate the station values in `df` (`lon`, `lat`, `elev`) onto a regular
+  `num_points` x `num_points` mesh covering the stations and smooth it.
 
+  :return: x_mesh, y_mesh, z_mesh
+  """
   # Convertion from dataframe to array
   x = numpy.asarray(df.lon.tolist()) # note: 'lon'
   y = numpy.asarray(df.lat.tolist()) # note: 'lat'
   z = numpy.asarray(df.elev.tolist())
 
   # Make a grid
-  x_arr          = numpy.linspace(numpy.min(x), numpy.max(x), 500)
-  y_arr          = numpy.linspace(numpy.min(y), numpy.max(y), 500)
+  x_arr          = numpy.linspace(numpy.min(x), numpy.max(x), num_points)
+  y_arr          = numpy.linspace(numpy.min(y), numpy.max(y), num_points)
   x_mesh, y_mesh = numpy.meshgrid(x_arr, y_arr)
 
   # Grid the elevation (Edited on March 30th, 2020)
@@ -770,28 +803,31 @@ def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_gree
   )
 
   # Use Gaussian filter to smoothen the contour
-  sigma = [1, 1]
-  z_mesh = scipy.ndimage.filters.gaussian_filter(
+  z_mesh = scipy.ndimage.gaussian_filter(
     z_mesh,
-    sigma,
+    list(sigma),
     mode='constant'
   )
 
-  # Create the contour
-  contourf = matplotlib.pyplot.contourf(
+  return x_mesh, y_mesh, z_mesh
+
+def make_contourf(x_mesh, y_mesh, z_mesh, colors, vmin, vmax):
+  """Create the filled contour of a gridded surface"""
+  return matplotlib.pyplot.contourf(
     x_mesh,
     y_mesh,
     z_mesh,
-    num_colors,
+    len(colors),
     alpha=0.5,
     colors=colors,
     linestyles='None',
-    vmin=elevation_min,
-    vmax=elevation_max
+    vmin=vmin,
+    vmax=vmax
   )
 
-  # Convert matplotlib contourf to geojson
-  geojson = geojsoncontour.contourf_to_geojson(
+def contourf_to_geojson(contourf):
+  """Convert matplotlib contourf to geojson"""
+  return geojsoncontour.contourf_to_geojson(
     contourf=contourf,
     min_angle_deg=3.0,
     ndigits=5,
@@ -799,6 +835,34 @@ def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_gree
     fill_opacity=0.1
   )
 
+def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_green', units='m'):
+  """
+  Save a standalone map of `elevation_column` to `output/`, with the contours
+  and stations embedded in the page so it opens straight from disk. For a
+  map that only loads what is in view, export vector tiles and serve them
+  with `python -m climatefind.tiles`.
+  """
+  df = get_elevation_df_from_summary_csv(elevation_column)
+  colors = MAP_COLORS[color_scheme]
+  num_colors = len(colors)
+
+  # Setup minimum and maximum values for the contour lines
+  elevation_min = df['elev'].min()
+  elevation_max = df['elev'].max()
+
+  # Setup colormap
+  color_map = branca.colormap.LinearColormap(
+    colors,
+    vmin=elevation_min,
+    vmax=elevation_max
+  ).to_step(
+    num_colors
+  )
+
+  x_mesh, y_mesh, z_mesh = grid_summary_df(df)
+  contourf = make_contourf(x_mesh, y_mesh, z_mesh, colors, elevation_min, elevation_max)
+  geojson = contourf_to_geojson(contourf)
+
   # Set up the map placeholdder
   geomap1 = folium.Map(
     location=[42.0573, -102.8017],
@@ -821,6 +885,12 @@ def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_gree
   color_map.caption = 'Elevation'
   geomap1.add_child(color_map)
 
+  # Bin the stations at low zoom so the browser doesn't draw thousands of overlapping dots
+  zoom_layers = climatefind.binning.add_bin_layers(geomap1, df, colors, elevation_min, elevation_max, units)
+  # Hidden until ZoomLayerToggle adds it at station zoom, so the browser never draws every station at once
+  stations_layer = folium.FeatureGroup(name='stations', show=False)
+  zoom_layers.append((stations_layer, ENV['binning']['station_zoom'], 99))
+
   # Add all stations to map
   for lat, lon, elev, name, id, elev_m in zip(
     df['lat'],
@@ -849,7 +919,9 @@ def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_gree
       fill=True,
       fillColor=this_color,
       fillOpacity=1.0
-    ).add_to(geomap1)
+    ).add_to(stations_layer)
+  stations_layer.add_to(geomap1)
+  climatefind.binning.ZoomLayerToggle(zoom_layers).add_to(geomap1)
 
   # Add the legend to the map
   folium.plugins.Fullscreen(
@@ -859,7 +931,8 @@ def make_folium_elevation_map(elevation_column='elev_m', color_scheme='high_gree
 
   test_html_filepath = f'''{GHCN_DIR}/output/{elevation_column}.{(ENV['map']['tiles']).replace(' ', '_')}.html'''
   geomap1.save(test_html_filepath)
-  subprocess.Popen(['open', '-a', 'Google Chrome', test_html_filepath])
+  if ENV['map']['open_browser'] and sys.platform == 'darwin':
+    subprocess.Popen(['open', '-a', 'Google Chrome', test_html_filepath])
 
   return True
 
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# Core
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import timeit
+
+# Contrib
+import numpy
+import pandas
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+def read_station_location(filepath):
+  """
+  Read only the header and first data row of a GHCN file.
+
+  :param filepath: Relative to ghcn/ like `read_usa_ghcn_file_meta`
+
+  :return: {'filename', 'lat', 'lon', 'state'} or None for non-US stations
+  """
+  with open(f'{MAIN.GHCN_DIR}/{filepath}', newline='') as f:
+    reader = csv.reader(f)
+    try:
+      header = next(reader)
+      first_data_row = dict(zip(header, next(reader)))
+    except StopIteration:
+      return None
+  name = first_data_row.get('NAME', '')
+  state = name[-5:-3]
+  if name[-2:] != 'US' or not MAIN.US_STATES.get(state):
+    return None
+  try:
+    return {
+      'filename': os.path.basename(filepath),
+      'lat': float(first_data_row['LATITUDE']),
+      'lon': float(first_data_row['LONGITUDE']),
+      'state': state,
+    }
+  except (KeyError, ValueError):
+    return None
+
+def get_candidate_stations():
+  """
+  :return: DataFrame of the US stations in the input queue with their location and filename hash
+  """
+  stations = [
+    read_station_location(f'input/queue/{file.name}')
+    for file in climatefind.get_input_queue()
+  ]
+  df = pandas.DataFrame([station for station in stations if station], columns=['filename', 'lat', 'lon', 'state'])
+  df['hash'] = [climatefind.utils.get_filename_hash(filename) for filename in df['filename']]
+  return df
+
+def stratified_sample(stations, cell_deg):
+  """
+  Pick one station per `cell_deg` x `cell_deg` grid cell: the one with the
+  lowest filename hash, so the pick is stable between runs and a finer grid
+  keeps every station a coarser grid picked.
+
+  :return: List of sampled filenames
+  """
+  if stations.empty:
+    return []
+  cells = pandas.DataFrame({
+    'cell_x': numpy.floor(stations['lon'].to_numpy() / cell_deg).astype(numpy.int64),
+    'cell_y': numpy.floor(stations['lat'].to_numpy() / cell_deg).astype(numpy.int64),
+    'hash': stations['hash'].to_numpy(),
+    'filename': stations['filename'].to_numpy(),
+  })
+  picks = cells.sort_values('hash').drop_duplicates(['cell_x', 'cell_y'], keep='first')
+  return picks['filename'].tolist()
+
+def process_station(filename):
+  """
+  Qualify and aggregate one station like `check_all_files` and
+  `spool_tmax_tmin` do, without writing to the spool.
+
+  :return: The station's summary row or None if it doesn't qualify
+  """
+  filepath = f'input/queue/{filename}'
+  meta = climatefind.read_usa_ghcn_file_meta(filepath)
+  if not meta or not meta['has_complete_temp_year']:
+    return None
+  year = climatefind.num_comfy_days_per_year_from_csv(climatefind.csv_from_temp_ghcn_file(filepath))
+  year['meta'] = meta
+  # Round trip through JSON to get the same shape as a spooled year
+  return climatefind.get_year_summary_row(json.loads(json.dumps(year)))
+
+def read_spooled_row(filename):
+  with open(f'{MAIN.GHCN_DIR}/spool/year/{filename}') as f:
+    return climatefind.get_year_summary_row(json.load(f))
+
+def run_preview(levels=None, workers=None, column=None):
+  """
+  Build a quick, low resolution map from a spatially stratified sample of the
+  stations, then refine it `levels` times, halving the grid cell each time.
+
+  Stations the full run already spooled to `spool/year/` are read instead of
+  being recomputed, so the preview keeps improving as the full run progresses.
+
+  :return: List of the PNG paths written after each refinement
+  """
+  env = MAIN.ENV['preview']
+  levels = env['levels'] if levels is None else levels
+  workers = workers or os.cpu_count()
+  column = column or env['column']
+  preview_dir = f'{MAIN.GHCN_DIR}/spool/preview'
+  os.makedirs(preview_dir, exist_ok=True)
+  summary_filepath = f'{preview_dir}/year.csv'
+
+  start_time = timeit.default_timer()
+  candidates = get_candidate_stations()
+  MAIN.LOG.info(f'Found {len(candidates)} candidate stations in {round((timeit.default_timer() - start_time), 1)}s')
+
+  rows = {}
+  tried = set()
+  png_filepaths = []
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=climatefind.init_worker, initargs=(MAIN.ENV,)) as executor:
+    for level in range(levels + 1):
+      cell_deg = env['cell_deg'] / (2 ** level)
+      sample = [filename for filename in stratified_sample(candidates, cell_deg) if filename not in tried]
+      tried.update(sample)
+      spooled = climatefind.get_spool()['year']
+      for filename in sample:
+        if filename in spooled:
+          rows[filename] = read_spooled_row(filename)
+      to_process = [filename for filename in sample if filename not in spooled]
+      for filename, row in zip(to_process, executor.map(process_station, to_process)):
+        if row:
+          rows[filename] = row
+
+      MAIN.LOG.info(f'Preview level {level} ({cell_deg} deg cells): {len(rows)} stations after {round((timeit.default_timer() - start_time), 1)}s')
+      if len(rows) < 4:
+        MAIN.LOG.warning(f'Not enough qualifying stations to grid at level {level}')
+        continue
+      pandas.DataFrame.from_dict(rows, orient='index').to_csv(summary_filepath)
+      png_filepaths += climatefind.render.render_pngs(
+        columns={ column: (f'preview_{column}', 'high_green') },
+        output_dir=f'{MAIN.GHCN_DIR}/output',
+        width=env['width'],
+        height=env['height'],
+        summary_filepath=summary_filepath,
+      )
+  return png_filepaths
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--levels', dest='levels', type=int, default=None, required=False)
+  parser.add_argument('--workers', dest='workers', type=int, default=None, required=False)
+  parser.add_argument('--column', dest='column', default=None, required=False)
+  args = parser.parse_args()
+
+  climatefind.read_env()
+  climatefind.setup_logger()
+  climatefind.setup_spool()
+  run_preview(levels=args.levels, workers=args.workers, column=args.column)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# Core
+import argparse
+import os
+import timeit
+
+# Contrib
+import matplotlib.colors
+import matplotlib.image
+import numpy
+import scipy.ndimage
+import scipy.spatial
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+def get_render_columns():
+  """
+  :return: Dict of summary column to (png name, color scheme) for the README images
+  """
+  columns = {
+    'average_comfy_days': ('ghcn_average_comfy_days', 'high_green'),
+    'total_comfy_days': ('ghcn_total_comfy_days', 'high_green'),
+  }
+  for month_num, month in climatefind.CALENDAR.items():
+    column = f'''{month['name']}_percent_comfy'''
+    columns[column] = (f'{month_num:02}_{column}', 'high_green')
+  return columns
+
+def make_pixel_mesh(bbox, width, height):
+  """
+  :param bbox: (lon_min, lat_min, lon_max, lat_max)
+  :return: lon and lat of every pixel center, north-up (row 0 is `lat_max`)
+  """
+  lon_min, lat_min, lon_max, lat_max = bbox
+  lon_step = (lon_max - lon_min) / width
+  lat_step = (lat_max - lat_min) / height
+  lon_arr = lon_min + (numpy.arange(width) + 0.5) * lon_step
+  lat_arr = lat_max - (numpy.arange(height) + 0.5) * lat_step
+  return numpy.meshgrid(lon_arr, lat_arr)
+
+def get_interpolation_weights(lon, lat, lon_mesh, lat_mesh):
+  """
+  Triangulate the stations once and find the barycentric weights of every
+  pixel so that any number of columns can be interpolated with a weighted sum.
+  This is the same linear interpolation `scipy.interpolate.griddata` does.
+
+  :return: vertices (pixels x 3), weights (pixels x 3), outside (pixels)
+  """
+  points = numpy.column_stack([lon, lat])
+  tri = scipy.spatial.Delaunay(points)
+  pixels = numpy.column_stack([lon_mesh.ravel(), lat_mesh.ravel()])
+  simplex = tri.find_simplex(pixels)
+  outside = simplex < 0
+  simplex[outside] = 0
+  transform = tri.transform[simplex]
+  bary = numpy.einsum('ijk,ik->ij', transform[:, :2, :], pixels - transform[:, 2, :])
+  weights = numpy.column_stack([bary, 1 - bary.sum(axis=1)])
+  return tri.simplices[simplex], weights, outside
+
+def interpolate_values(values, vertices, weights, outside, shape, sigma):
+  """
+  :return: Smoothed surface of `values` with NaN outside the stations' hull
+  """
+  surface = numpy.einsum('ij,ij->i', values[vertices], weights)
+  surface[outside] = 0
+  surface = scipy.ndimage.gaussian_filter(surface.reshape(shape), sigma, mode='constant')
+  surface[outside.reshape(shape)] = numpy.nan
+  return surface
+
+def get_color_lut(colors):
+  """
+  :return: Array of RGBA uint8 colors, one per color step
+  """
+  return (numpy.array([matplotlib.colors.to_rgba(color) for color in colors]) * 255).astype(numpy.uint8)
+
+def get_color_index(values, vmin, vmax, num_colors):
+  """Step `values` onto a color index like the folium step colormap does"""
+  scaled = (numpy.asarray(values, dtype=numpy.float64) - vmin) / max(vmax - vmin, 1e-9)
+  return numpy.clip(numpy.floor(scaled * num_colors), 0, num_colors - 1).astype(numpy.intp)
+
+def colorize(surface, lut, vmin, vmax, background):
+  image = numpy.empty(surface.shape + (4,), dtype=numpy.uint8)
+  image[:] = (numpy.array(matplotlib.colors.to_rgba(background)) * 255).astype(numpy.uint8)
+  valid = ~numpy.isnan(surface)
+  image[valid] = lut[get_color_index(surface[valid], vmin, vmax, len(lut))]
+  return image
+
+def draw_stations(image, rows, cols, colors, radius_px):
+  """Stamp a filled disc of `colors` onto `image` at every station pixel"""
+  height, width = image.shape[:2]
+  offsets = [
+    (dr, dc)
+    for dr in range(-radius_px, radius_px + 1)
+    for dc in range(-radius_px, radius_px + 1)
+    if (dr * dr) + (dc * dc) <= (radius_px * radius_px)
+  ]
+  for dr, dc in offsets:
+    r = rows + dr
+    c = cols + dc
+    inside = (r >= 0) & (r < height) & (c >= 0) & (c < width)
+    image[r[inside], c[inside]] = colors[inside]
+  return image
+
+def render_pngs(columns=None, output_dir=None, bbox=None, width=None, height=None, summary_filepath=None):
+  """
+  Rasterize the gridded comfort surface and the stations for each summary
+  column straight to a PNG without a browser or a network basemap.
+
+  :param columns: Dict of summary column to (png name, color scheme), defaults to the README images
+  :param bbox: (lon_min, lat_min, lon_max, lat_max)
+  :param summary_filepath: Summary CSV to render, defaults to `spool/comfy/year.csv`
+  :return: List of written PNG paths
+  """
+  start_time = timeit.default_timer()
+  env = MAIN.ENV['render']
+  columns = columns or get_render_columns()
+  output_dir = output_dir or os.path.join(MAIN.GHCN_DIR, env['output_dir'])
+  bbox = bbox or env['bbox']
+  width = width or env['width']
+  height = height or env['height']
+  os.makedirs(output_dir, exist_ok=True)
+
+  df = climatefind.summary.get_year_summary(summary_filepath).columns(['lat', 'lon'] + list(columns)).dropna(subset=['lat', 'lon'])
+  lon = df['lon'].to_numpy(dtype=numpy.float64)
+  lat = df['lat'].to_numpy(dtype=numpy.float64)
+
+  lon_mesh, lat_mesh = make_pixel_mesh(bbox, width, height)
+  vertices, weights, outside = get_interpolation_weights(lon, lat, lon_mesh, lat_mesh)
+
+  lon_min, lat_min, lon_max, lat_max = bbox
+  station_cols = numpy.floor((lon - lon_min) / (lon_max - lon_min) * width).astype(numpy.intp)
+  station_rows = numpy.floor((lat_max - lat) / (lat_max - lat_min) * height).astype(numpy.intp)
+
+  png_filepaths = []
+  for column, (png_name, color_scheme) in columns.items():
+    values = df[column].to_numpy(dtype=numpy.float64)
+    vmin = numpy.nanmin(values)
+    vmax = numpy.nanmax(values)
+    lut = get_color_lut(climatefind.MAP_COLORS[color_scheme])
+    surface = interpolate_values(values, vertices, weights, outside, lon_mesh.shape, env['sigma_px'])
+    image = colorize(surface, lut, vmin, vmax, env['background'])
+    image = draw_stations(
+      image,
+      station_rows,
+      station_cols,
+      lut[get_color_index(values, vmin, vmax, len(lut))],
+      env['station_radius_px'],
+    )
+    png_filepath = os.path.join(output_dir, f'{png_name}.png')
+    matplotlib.image.imsave(png_filepath, image)
+    png_filepaths.append(png_filepath)
+    MAIN.LOG.info(f'Wrote {png_filepath}')
+
+  MAIN.LOG.info(f'Rendered {len(png_filepaths)} images in {round((timeit.default_timer() - start_time), 1)}s')
+  return png_filepaths
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--column', dest='columns', action='append', default=None, required=False)
+  parser.add_argument('--output-dir', dest='output_dir', default=None, required=False)
+  parser.add_argument('--bbox', dest='bbox', type=float, nargs=4, default=None, required=False,
+                      metavar=('LON_MIN', 'LAT_MIN', 'LON_MAX', 'LAT_MAX'))
+  parser.add_argument('--width', dest='width', type=int, default=None, required=False)
+  parser.add_argument('--height', dest='height', type=int, default=None, required=False)
+  args = parser.parse_args()
+
+  climatefind.read_env()
+  climatefind.setup_logger()
+
+  columns = None
+  if args.columns:
+    all_columns = get_render_columns()
+    columns = { column: all_columns.get(column, (column, 'high_green')) for column in args.columns }
+  render_pngs(columns=columns, output_dir=args.output_dir, bbox=args.bbox, width=args.width, height=args.height)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+Daily comfort rules written in env.yml and compiled to NumPy.
+
+A rule is a tree of YAML mappings. Leaves compare one daily column:
+
+  {column: TMAX, between: [10, 20]}  # Inclusive at both ends
+  {column: PRCP, lt: 1}              # Also le, gt, ge, eq, ne
+
+and branches combine other rules:
+
+  {all: [<rule>, ...]}
+  {any: [<rule>, ...]}
+  {not: <rule>}
+
+Columns are in the units below rather than GHCN's tenths. A day missing a
+column fails every comparison on it, `ne` included, and every `not` over a
+rule that reads it, so a missing value never makes a day comfy.
+"""
+
+# Core
+import json
+import operator
+
+# Contrib
+import numpy
+
+# GHCN daily column: raw file values per unit rules are written in
+COLUMN_DIVISORS = {
+  'TMAX': 10,  # C
+  'TMIN': 10,  # C
+  'TAVG': 10,  # C
+  'PRCP': 10,  # mm
+  'SNWD': 1,  # mm
+}
+
+COMPARISONS = {
+  'lt': operator.lt,
+  'le': operator.le,
+  'gt': operator.gt,
+  'ge': operator.ge,
+  'eq': operator.eq,
+  'ne': operator.ne,
+}
+
+# Rules compiled by this process, by their JSON
+COMPILED_RULES = {}
+
+def get_default_rule(comfy_env):
+  """
+  :param comfy_env: The `comfy` section of env.yml
+  :return: The rule `is_comfy_day` applies
+  """
+  return {
+    'any': [
+      {'column': 'TMAX', 'between': [comfy_env['tmax_solo']['min'], comfy_env['tmax_solo']['max']]},
+      {'all': [
+        {'column': 'TMAX', 'gt': comfy_env['tmax_solo']['max']},
+        {'column': 'TMIN', 'le': comfy_env['tmin_if_tmax_above_max']},
+      ]},
+    ]
+  }
+
+def get_rule(comfy_env):
+  """
+  :return: The `comfy.rule` of env.yml, or the `is_comfy_day` rule if it isn't set
+  """
+  return comfy_env.get('rule') or get_default_rule(comfy_env)
+
+def compile_rule(rule):
+  """
+  :return: evaluate, columns where `evaluate(columns_dict)` takes a dict of
+    column name to array (in rule units, see `get_columns`) and returns a boolean array, and
+    `columns` is the sorted list of columns the rule reads
+  """
+  key = json.dumps(rule, sort_keys=True)
+  if key not in COMPILED_RULES:
+    columns = set()
+    COMPILED_RULES[key] = (compile_node(rule, columns), sorted(columns))
+  return COMPILED_RULES[key]
+
+def compile_node(node, columns):
+  if not isinstance(node, dict):
+    raise ValueError(f'Rule must be a mapping, got {node!r}')
+
+  if 'all' in node and 'any' in node:
+    raise ValueError(f'Rule {node!r} must have one of all, any')
+
+  if 'all' in node or 'any' in node:
+    combine = numpy.logical_and if 'all' in node else numpy.logical_or
+    children = [compile_node(child, columns) for child in node.get('all', node.get('any'))]
+    if not children:
+      raise ValueError(f'Rule {node!r} has nothing to combine')
+    def evaluate(data):
+      result = children[0](data)
+      for child in children[1:]:
+        result = combine(result, child(data))
+      return result
+    return evaluate
+
+  if 'not' in node:
+    child_columns = set()
+    child = compile_node(node['not'], child_columns)
+    columns.update(child_columns)
+    def evaluate(data):
+      result = ~child(data)
+      for column in child_columns:
+        result &= ~numpy.isnan(data[column])
+      return result
+    return evaluate
+
+  column = node.get('column')
+  if column not in COLUMN_DIVISORS:
+    raise ValueError(f'Rule {node!r} must compare one of the columns {list(COLUMN_DIVISORS)}')
+  columns.add(column)
+
+  tests = [name for name in node if name != 'column']
+  if len(tests) != 1 or tests[0] not in ['between', *COMPARISONS]:
+    raise ValueError(f'Rule {node!r} must have exactly one of between, {", ".join(COMPARISONS)}')
+
+  if tests[0] == 'between':
+    low, high = (float(x) for x in node['between'])
+    return lambda data: (low <= data[column]) & (data[column] <= high)
+
+  compare = COMPARISONS[tests[0]]
+  value = float(node[tests[0]])
+  return lambda data: compare(data[column], value) & ~numpy.isnan(data[column])
+
+def get_columns(csv, columns):
+  """
+  :param csv: DataFrame of a GHCN daily file
+  :return: Dict of column name to float array in rule units (all NaN if the file lacks the column)
+  """
+  return {
+    column: (
+      csv[column].to_numpy(dtype=numpy.float64) / COLUMN_DIVISORS[column]
+      if column in csv
+      else numpy.full(len(csv), numpy.nan)
+    )
+    for column in columns
+  }
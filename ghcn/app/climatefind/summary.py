@@ -0,0 +1,96 @@
+# Core
+import logging
+import os
+
+# Contrib
+import numpy
+import pandas
+
+# This module
+from climatefind.main import MAIN
+
+SUMMARY_DTYPES = {
+  'id': 'string',
+  'state': 'category',
+  'start_date': 'string',
+  'end_date': 'string',
+  'lat': numpy.float32,
+  'lon': numpy.float32,
+  'elev_m': numpy.float32,
+  'total_comfy_days': numpy.float32,
+  'average_comfy_days': numpy.float64,
+  'aug_1_tmin': numpy.float32,
+  'aug_1_tmax': numpy.float32,
+  'name': 'string',
+}
+
+SUMMARIES = {}
+
+# The logger setup_logger() configures, usable before it has been (unlike
+# MAIN.LOG, which only exists once it has)
+LOG = logging.getLogger(MAIN.__name__)
+
+class YearSummary:
+  """
+  Process-wide cache of the `spool/comfy/year.csv` summary.
+
+  Columns are parsed the first time they are asked for and then handed out
+  from memory until the file's mtime changes.
+  """
+
+  def __init__(self, filepath):
+    self.filepath = filepath
+    self.mtime_ns = None
+    self.frame = pandas.DataFrame()
+
+  def is_stale(self):
+    return os.stat(self.filepath).st_mtime_ns != self.mtime_ns
+
+  def invalidate(self):
+    self.mtime_ns = None
+    self.frame = pandas.DataFrame()
+
+  def load(self, columns):
+    """Parse any of `columns` that aren't cached yet"""
+    if self.is_stale():
+      self.invalidate()
+    missing = [column for column in columns if column not in self.frame.columns]
+    if not missing:
+      return
+    mtime_ns = os.stat(self.filepath).st_mtime_ns
+    loaded = pandas.read_csv(
+      self.filepath,
+      usecols=missing,
+      dtype={ column: SUMMARY_DTYPES.get(column, numpy.float64) for column in missing }
+    )
+    LOG.debug(f'Loaded {missing} from {self.filepath}')
+    if self.frame.empty:
+      self.frame = loaded
+    else:
+      self.frame = pandas.concat([self.frame, loaded], axis=1)
+    self.mtime_ns = mtime_ns
+
+  def column(self, column):
+    """
+    :return: The cached Series for `column` (treat as read-only)
+    """
+    self.load([column])
+    return self.frame[column]
+
+  def columns(self, columns):
+    """
+    :return: A new DataFrame with a copy of `columns`, safe to modify; use
+      `column()` for the cached Series themselves
+    """
+    self.load(columns)
+    return self.frame[list(columns)]
+
+def get_year_summary(filepath=None):
+  """
+  :return: The process-wide YearSummary for `filepath` (default `spool/comfy/year.csv`)
+  """
+  if not filepath:
+    filepath = f'{MAIN.GHCN_DIR}/spool/comfy/year.csv'
+  if filepath not in SUMMARIES:
+    SUMMARIES[filepath] = YearSummary(filepath)
+  return SUMMARIES[filepath]
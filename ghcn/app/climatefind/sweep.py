@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Core
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import pathlib
+import timeit
+
+# Contrib
+import numpy
+import pandas
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+# The `comfy` settings `is_comfy_day` reads, as sweep columns
+THRESHOLD_COLUMNS = ['tmax_solo_min', 'tmax_solo_max', 'tmin_if_tmax_above_max']
+
+def get_threshold_grid(env=None):
+  """
+  :param env: The `sweep` section of env.yml (default: `MAIN.ENV['sweep']`)
+  :return: DataFrame with one row per combination of the swept `comfy` settings
+  """
+  env = env or MAIN.ENV['sweep']
+  return pandas.DataFrame(
+    list(itertools.product(*[env[column] for column in THRESHOLD_COLUMNS])),
+    columns=THRESHOLD_COLUMNS,
+    dtype=numpy.float64,
+  )
+
+def read_station_days(filepath):
+  """
+  Read a station's daily TMAX/TMIN once, keeping the same days
+  `num_comfy_days_per_year_from_csv` counts.
+
+  :param filepath: Relative to ghcn/ like `csv_from_temp_ghcn_file`
+  :return: day_index (0-based day of a 365 day year), tmax, tmin (C) arrays
+  """
+  csv = pandas.read_csv(f'{MAIN.GHCN_DIR}/{filepath}', usecols=['DATE', 'TMAX', 'TMIN'])
+  day_index = climatefind.get_day_of_year_index(csv['DATE'])
+  tmax = csv['TMAX'].to_numpy(dtype=numpy.float64)
+  tmin = csv['TMIN'].to_numpy(dtype=numpy.float64)
+  keep = (day_index >= 0) & ~numpy.isnan(tmax) & ~numpy.isnan(tmin)
+  return day_index[keep], climatefind.normalize_temperature(tmax[keep]), climatefind.normalize_temperature(tmin[keep])
+
+def is_comfy_day_grid(tmax, tmin, grid):
+  """
+  `is_comfy_day` for every day against every row of the threshold grid at once.
+
+  :return: Boolean array of shape (len(grid), len(tmax))
+  """
+  return climatefind.is_comfy_day(tmax, tmin, **{
+    column: grid[column].to_numpy()[:, numpy.newaxis] for column in THRESHOLD_COLUMNS
+  })
+
+def summarize_comfy_days(day_index, comfy):
+  """
+  `summarize_year` for any number of settings at once: a calendar day is
+  comfy if at least half its years were, and the average counts the comfy
+  fraction of each day, rounded per month and then per year like
+  `summarize_month` and `summarize_year` round.
+
+  :param day_index: (days,) 0-based day of the year of each observed day
+  :param comfy: (settings, days) boolean
+  :return: total_comfy_days, average_comfy_days arrays of shape (settings,)
+  """
+  num_settings = comfy.shape[0]
+  observed = numpy.bincount(day_index, minlength=365)
+  comfy_counts = numpy.bincount(
+    (numpy.arange(num_settings)[:, numpy.newaxis] * 365 + day_index).ravel(),
+    weights=comfy.ravel(),
+    minlength=num_settings * 365,
+  ).reshape(num_settings, 365)
+  total_comfy_days = (comfy_counts >= (observed - comfy_counts)).sum(axis=1)
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    average_by_month = numpy.add.reduceat(comfy_counts / observed, MAIN.DAYS_BEFORE_MONTH, axis=1).round(2)
+  return total_comfy_days, average_by_month.sum(axis=1).round(2)
+
+def sweep_station(filename, grid):
+  """
+  :return: DataFrame with the station's comfy days for every row of `grid`
+  """
+  with open(f'{MAIN.GHCN_DIR}/spool/meta/{filename}') as f:
+    meta = json.load(f)
+  day_index, tmax, tmin = read_station_days(f'input/queue/{filename}')
+  total_comfy_days, average_comfy_days = summarize_comfy_days(day_index, is_comfy_day_grid(tmax, tmin, grid))
+  rows = grid.copy()
+  rows.insert(0, 'id', meta['id'])
+  rows.insert(1, 'state', meta['state'])
+  rows.insert(2, 'lat', meta['lat'])
+  rows.insert(3, 'lon', meta['lon'])
+  rows.insert(4, 'elev_m', meta['elev_m'])
+  rows['total_comfy_days'] = total_comfy_days
+  rows['average_comfy_days'] = average_comfy_days
+  return rows
+
+def summarize_national(stations):
+  """
+  :return: One row per setting summarizing every station's comfy days
+  """
+  return stations.groupby(THRESHOLD_COLUMNS).agg(
+    num_stations=('id', 'count'),
+    mean_total_comfy_days=('total_comfy_days', 'mean'),
+    mean_average_comfy_days=('average_comfy_days', 'mean'),
+    median_average_comfy_days=('average_comfy_days', 'median'),
+  ).reset_index()
+
+def run_sweep(grid=None, workers=None):
+  """
+  Evaluate `is_comfy_day` for every threshold setting in the grid over every
+  qualifying (`spool/meta/`) station, reading each station once, and write
+  `spool/sweep/stations.csv` (one row per station and setting) and
+  `spool/sweep/national.csv` (one row per setting).
+
+  :return: stations, national DataFrames (None if there are no stations)
+  """
+  grid = get_threshold_grid() if grid is None else grid
+  workers = workers or MAIN.ENV['sweep']['workers'] or os.cpu_count()
+  start_time = timeit.default_timer()
+  filenames = sorted(
+    os.path.basename(file)
+    for file in pathlib.Path(os.path.join(MAIN.GHCN_DIR, 'spool', 'meta')).glob(MAIN.ENV['input']['file_glob'])
+  )
+
+  if not filenames:
+    MAIN.LOG.warning('No qualifying stations in spool/meta/ to sweep')
+    return None, None
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=climatefind.init_worker, initargs=(MAIN.ENV,)) as executor:
+    stations = pandas.concat(executor.map(sweep_station, filenames, itertools.repeat(grid)), ignore_index=True)
+  national = summarize_national(stations)
+
+  sweep_dir = f'{MAIN.GHCN_DIR}/spool/sweep'
+  os.makedirs(sweep_dir, exist_ok=True)
+  stations.to_csv(f'{sweep_dir}/stations.csv', index=False)
+  national.to_csv(f'{sweep_dir}/national.csv', index=False)
+  MAIN.LOG.info(f'Swept {len(grid)} settings over {len(filenames)} stations in {round((timeit.default_timer() - start_time), 1)}s')
+  return stations, national
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--workers', dest='workers', type=int, default=None, required=False)
+  args = parser.parse_args()
+
+  climatefind.read_env()
+  climatefind.setup_logger()
+  climatefind.setup_spool()
+  run_sweep(workers=args.workers)
+
+if __name__ == "__main__":
+    main()
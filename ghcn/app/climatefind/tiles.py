@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+# Core
+import argparse
+import gzip
+import http.server
+import json
+import math
+import os
+import re
+import sqlite3
+import timeit
+
+# Contrib
+import folium
+import folium.plugins
+import mapbox_vector_tile
+import numpy
+import shapely.geometry
+import shapely.ops
+
+# This module
+import climatefind
+from climatefind.main import MAIN
+
+EARTH_RADIUS_M = 6378137.0
+WORLD_WIDTH_M = 2 * math.pi * EARTH_RADIUS_M
+TILE_SIZE_PX = 256
+
+TILE_URL_PATTERN = re.compile(r'^/tiles/(\d+)/(\d+)/(\d+)\.pbf$')
+
+def lonlat_to_mercator(lon, lat):
+  """Project lon/lat degrees (scalars or arrays) onto web mercator meters"""
+  lon = numpy.asarray(lon, dtype=numpy.float64)
+  lat = numpy.clip(numpy.asarray(lat, dtype=numpy.float64), -85.0511, 85.0511)
+  x = numpy.radians(lon) * EARTH_RADIUS_M
+  y = numpy.log(numpy.tan((numpy.pi / 4) + (numpy.radians(lat) / 2))) * EARTH_RADIUS_M
+  return x, y
+
+def mercator_to_lonlat(x, y):
+  """Unproject web mercator meters (scalars or arrays) onto lon/lat degrees"""
+  lon = numpy.degrees(numpy.asarray(x, dtype=numpy.float64) / EARTH_RADIUS_M)
+  lat = numpy.degrees((2 * numpy.arctan(numpy.exp(numpy.asarray(y, dtype=numpy.float64) / EARTH_RADIUS_M))) - (numpy.pi / 2))
+  return lon, lat
+
+def meters_per_pixel(zoom):
+  return WORLD_WIDTH_M / (TILE_SIZE_PX * (2 ** zoom))
+
+def tile_bounds(zoom, x, y):
+  """
+  :return: (minx, miny, maxx, maxy) of XYZ tile `x`,`y` in web mercator meters
+  """
+  tile_width = WORLD_WIDTH_M / (2 ** zoom)
+  minx = -(WORLD_WIDTH_M / 2) + (x * tile_width)
+  maxy = (WORLD_WIDTH_M / 2) - (y * tile_width)
+  return (minx, maxy - tile_width, minx + tile_width, maxy)
+
+def tile_range(bounds, zoom):
+  """
+  :param bounds: (minx, miny, maxx, maxy) in web mercator meters
+  :return: range of x and range of y for the XYZ tiles covering `bounds`
+  """
+  num_tiles = 2 ** zoom
+  tile_width = WORLD_WIDTH_M / num_tiles
+  minx, miny, maxx, maxy = bounds
+  x_min = int((minx + (WORLD_WIDTH_M / 2)) // tile_width)
+  x_max = int((maxx + (WORLD_WIDTH_M / 2)) // tile_width)
+  y_min = int(((WORLD_WIDTH_M / 2) - maxy) // tile_width)
+  y_max = int(((WORLD_WIDTH_M / 2) - miny) // tile_width)
+  return (
+    range(max(x_min, 0), min(x_max, num_tiles - 1) + 1),
+    range(max(y_min, 0), min(y_max, num_tiles - 1) + 1),
+  )
+
+def get_contour_geometries(df, colors, vmin, vmax):
+  """
+  Grid and contour the summary `df` the same way the folium map does.
+
+  :return: List of (shapely geometry in web mercator meters, properties) tuples
+  """
+  x_mesh, y_mesh, z_mesh = climatefind.grid_summary_df(df)
+  contourf = climatefind.make_contourf(x_mesh, y_mesh, z_mesh, colors, vmin, vmax)
+  geojson = json.loads(climatefind.contourf_to_geojson(contourf))
+  contours = []
+  for feature in geojson['features']:
+    geometry = shapely.ops.transform(
+      lambda lon, lat: lonlat_to_mercator(lon, lat),
+      shapely.geometry.shape(feature['geometry'])
+    )
+    # geojsoncontour's polygons can self-intersect, which GEOS can't clip
+    if not geometry.is_valid:
+      geometry = geometry.buffer(0)
+    if geometry.is_empty:
+      continue
+    contours.append((geometry, {
+      'fill': feature['properties']['fill'],
+      'stroke': feature['properties']['stroke'],
+      'title': feature['properties'].get('title', ''),
+    }))
+  return contours
+
+def get_station_features(df, colors, vmin, vmax, units=''):
+  """
+  :return: Dict of station arrays in web mercator meters plus their properties
+  """
+  x, y = lonlat_to_mercator(df['lon'].to_numpy(), df['lat'].to_numpy())
+  properties = [
+    {
+      'id': id,
+      'name': name,
+      'value': float(elev),
+      'tooltip': f'{id} {name} {lat},{lon} @ {elev} {units}',
+      'color': climatefind.scale_onto_array(vmin=vmin, vmax=vmax, val=elev, arr=colors),
+    }
+    for id, name, lat, lon, elev in zip(df['id'], df['name'], df['lat'], df['lon'], df['elev'])
+  ]
+  return {
+    'x': x,
+    'y': y,
+    'properties': properties,
+  }
+
+def thin_stations(stations, zoom, cell_px):
+  """
+  Keep at most one station per `cell_px` x `cell_px` pixel cell at `zoom`.
+
+  :return: Index array of the stations to keep
+  """
+  cell_m = meters_per_pixel(zoom) * cell_px
+  cells = numpy.stack([
+    numpy.floor(stations['x'] / cell_m),
+    numpy.floor(stations['y'] / cell_m),
+  ], axis=1).astype(numpy.int64)
+  _, keep = numpy.unique(cells, axis=0, return_index=True)
+  return numpy.sort(keep)
+
+def simplify_contours(contours, zoom, simplify_px):
+  tolerance = meters_per_pixel(zoom) * simplify_px
+  simplified = []
+  for geometry, properties in contours:
+    geometry = geometry.simplify(tolerance, preserve_topology=True)
+    if not geometry.is_empty:
+      simplified.append((geometry, properties))
+  return simplified
+
+def get_polygon_bounds(polygons):
+  """
+  :return: (polygons x 4) array of each (geometry, properties) polygon's bounds
+  """
+  return numpy.array([geometry.bounds for geometry, properties in polygons]).reshape(-1, 4)
+
+def get_bin_polygons(stations, values, zoom, colors, vmin, vmax, units=''):
+  """
+  Bin the stations at `zoom` like the folium map does below
+  `binning.station_zoom`.
+
+  :return: List of (shapely bin polygon in web mercator meters, properties) tuples
+  """
+  env = MAIN.ENV['binning']
+  size = climatefind.binning.get_bin_size_m(zoom, env['bin_px'])
+  bins = climatefind.binning.bin_values(stations['x'], stations['y'], values, size, env['kind'])
+  feature_collection = climatefind.binning.bins_to_geojson(bins, size, env['kind'], colors, vmin, vmax, units)
+  polygons = []
+  for feature in feature_collection['features']:
+    geometry = shapely.ops.transform(
+      lambda lon, lat: lonlat_to_mercator(lon, lat),
+      shapely.geometry.shape(feature['geometry'])
+    )
+    polygons.append((geometry, feature['properties']))
+  return polygons
+
+def clip_polygons(polygons, polygon_bounds, clip_box):
+  minx, miny, maxx, maxy = clip_box.bounds
+  features = []
+  if len(polygons):
+    overlapping = numpy.flatnonzero(
+      (polygon_bounds[:, 0] <= maxx)
+      & (polygon_bounds[:, 2] >= minx)
+      & (polygon_bounds[:, 1] <= maxy)
+      & (polygon_bounds[:, 3] >= miny)
+    )
+    for i in overlapping:
+      geometry, properties = polygons[i]
+      clipped = geometry.intersection(clip_box)
+      if not clipped.is_empty:
+        features.append({'geometry': clipped, 'properties': properties})
+  return features
+
+def encode_tile(zoom, x, y, polygon_layers, stations, station_idx, extent, buffer_px):
+  """
+  Clip the polygon layers and stations to tile `zoom`/`x`/`y` and encode them
+  as a gzipped Mapbox Vector Tile.
+
+  :param polygon_layers: Dict of layer name to (polygons, polygon bounds)
+  :return: The tile bytes or None if the tile is empty
+  """
+  minx, miny, maxx, maxy = tile_bounds(zoom, x, y)
+  buffer_m = meters_per_pixel(zoom) * buffer_px
+  clip_box = shapely.geometry.box(minx - buffer_m, miny - buffer_m, maxx + buffer_m, maxy + buffer_m)
+
+  layers = [
+    {'name': name, 'features': clip_polygons(polygons, polygon_bounds, clip_box)}
+    for name, (polygons, polygon_bounds) in polygon_layers.items()
+  ]
+
+  station_features = []
+  in_tile = station_idx[
+    (stations['x'][station_idx] >= minx - buffer_m)
+    & (stations['x'][station_idx] <= maxx + buffer_m)
+    & (stations['y'][station_idx] >= miny - buffer_m)
+    & (stations['y'][station_idx] <= maxy + buffer_m)
+  ]
+  for i in in_tile:
+    station_features.append({
+      'geometry': shapely.geometry.Point(stations['x'][i], stations['y'][i]),
+      'properties': stations['properties'][i],
+    })
+
+  layers.append({'name': 'stations', 'features': station_features})
+  if not any(layer['features'] for layer in layers):
+    return None
+
+  tile = mapbox_vector_tile.encode(
+    layers,
+    default_options={
+      'quantize_bounds': (minx, miny, maxx, maxy),
+      'extents': extent,
+    }
+  )
+  return gzip.compress(tile)
+
+def create_mbtiles(mbtiles_filepath, metadata):
+  if os.path.exists(mbtiles_filepath):
+    os.remove(mbtiles_filepath)
+  db = sqlite3.connect(mbtiles_filepath)
+  db.execute('CREATE TABLE metadata (name text, value text)')
+  db.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+  db.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+  db.executemany('INSERT INTO metadata (name, value) VALUES (?, ?)', metadata.items())
+  return db
+
+def get_mbtiles_filepath(elevation_column):
+  return f'{MAIN.GHCN_DIR}/output/{elevation_column}.mbtiles'
+
+def export_mbtiles(elevation_column='average_comfy_days', color_scheme='high_green', units='days/year', mbtiles_filepath=None):
+  """
+  Write a multi-zoom vector tile pyramid of the comfort contours and stations
+  to an MBTiles (SQLite) file.
+
+  Contours are simplified per zoom level. Below `binning.station_zoom` the
+  stations are aggregated into bins, above it they are thinned to one per
+  pixel cell, so that low zoom tiles stay small.
+
+  :return: Path to the MBTiles file
+  """
+  start_time = timeit.default_timer()
+  env = MAIN.ENV['tiles']
+  if not mbtiles_filepath:
+    mbtiles_filepath = get_mbtiles_filepath(elevation_column)
+
+  df = climatefind.get_elevation_df_from_summary_csv(elevation_column)
+  colors = climatefind.MAP_COLORS[color_scheme]
+  vmin = df['elev'].min()
+  vmax = df['elev'].max()
+
+  contours = get_contour_geometries(df, colors, vmin, vmax)
+  stations = get_station_features(df, colors, vmin, vmax, units)
+  bounds = (
+    stations['x'].min(),
+    stations['y'].min(),
+    stations['x'].max(),
+    stations['y'].max(),
+  )
+
+  metadata = {
+    'name': elevation_column,
+    'format': 'pbf',
+    'type': 'overlay',
+    'version': '1',
+    'description': f'{elevation_column} ({units})',
+    'minzoom': str(env['min_zoom']),
+    'maxzoom': str(env['max_zoom']),
+    'bounds': ','.join(str(round(i, 5)) for i in [df['lon'].min(), df['lat'].min(), df['lon'].max(), df['lat'].max()]),
+    'center': f'''{round(df['lon'].mean(), 5)},{round(df['lat'].mean(), 5)},{env['min_zoom']}''',
+    'json': json.dumps({
+      'vector_layers': [
+        {'id': 'contours', 'fields': {'fill': 'String', 'stroke': 'String', 'title': 'String'}},
+        {'id': 'bins', 'fields': {'count': 'Number', 'mean': 'Number', 'min': 'Number', 'max': 'Number', 'tooltip': 'String', 'color': 'String'}},
+        {'id': 'stations', 'fields': {'id': 'String', 'name': 'String', 'value': 'Number', 'tooltip': 'String', 'color': 'String'}},
+      ]
+    }),
+  }
+  db = create_mbtiles(mbtiles_filepath, metadata)
+
+  num_tiles = 0
+  for zoom in range(env['min_zoom'], env['max_zoom'] + 1):
+    zoom_contours = simplify_contours(contours, zoom, env['simplify_px'])
+    polygon_layers = {
+      'contours': (zoom_contours, get_polygon_bounds(zoom_contours)),
+    }
+    if zoom < MAIN.ENV['binning']['station_zoom']:
+      bins = get_bin_polygons(stations, df['elev'].to_numpy(), zoom, colors, vmin, vmax, units)
+      polygon_layers['bins'] = (bins, get_polygon_bounds(bins))
+      station_idx = numpy.array([], dtype=numpy.intp)
+    else:
+      station_idx = thin_stations(stations, zoom, env['station_cell_px'])
+    x_range, y_range = tile_range(bounds, zoom)
+    rows = []
+    for x in x_range:
+      for y in y_range:
+        tile = encode_tile(zoom, x, y, polygon_layers, stations, station_idx, env['extent'], env['buffer_px'])
+        if tile:
+          # MBTiles uses TMS row numbering
+          rows.append((zoom, x, (2 ** zoom) - 1 - y, tile))
+    db.executemany('INSERT INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)', rows)
+    db.commit()
+    num_tiles += len(rows)
+    MAIN.LOG.info(f'Wrote {len(rows)} tiles for zoom {zoom} ({len(station_idx)} stations)')
+
+  db.close()
+  MAIN.LOG.info(f'Wrote {num_tiles} tiles to {mbtiles_filepath} in {round((timeit.default_timer() - start_time), 1)}s')
+  return mbtiles_filepath
+
+def read_mbtiles_metadata(mbtiles_filepath):
+  db = sqlite3.connect(mbtiles_filepath)
+  metadata = dict(db.execute('SELECT name, value FROM metadata').fetchall())
+  db.close()
+  return metadata
+
+def read_tile(db, zoom, x, y):
+  row = db.execute(
+    'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+    (zoom, x, (2 ** zoom) - 1 - y)
+  ).fetchone()
+  return row[0] if row else None
+
+def make_folium_tile_map(tile_url, metadata):
+  """
+  :return: A folium map that only loads the vector tiles in view from `tile_url`
+  """
+  lon, lat, zoom = [float(i) for i in metadata['center'].split(',')]
+  geomap = folium.Map(
+    location=[lat, lon],
+    zoom_start=int(zoom),
+    tiles=MAIN.ENV['map']['tiles']
+  )
+  options = '''{
+    "maxNativeZoom": %s,
+    "interactive": true,
+    "getFeatureId": function(f) { return f.properties.id; },
+    "vectorTileLayerStyles": {
+      "contours": function(p) {
+        return {"fill": true, "fillColor": p.fill, "fillOpacity": 0.5, "color": p.stroke, "weight": 2, "opacity": 0.9};
+      },
+      "bins": function(p) {
+        return {"fill": true, "fillColor": p.color, "fillOpacity": 0.7, "color": p.color, "weight": 1, "opacity": 0.9};
+      },
+      "stations": function(p) {
+        return {"radius": 4, "fill": true, "fillColor": p.color, "fillOpacity": 1.0, "color": p.color};
+      }
+    }
+  }''' % metadata['maxzoom']
+  folium.plugins.VectorGridProtobuf(tile_url, metadata['name'], options).add_to(geomap)
+  folium.plugins.Fullscreen(
+    position='topright',
+    force_separate_button=True
+  ).add_to(geomap)
+  return geomap
+
+def serve_mbtiles(mbtiles_filepath, port=None):
+  """
+  Serve a map page at `/` and the tiles of `mbtiles_filepath` at
+  `/tiles/{z}/{x}/{y}.pbf` on localhost.
+  """
+  if not port:
+    port = MAIN.ENV['tiles']['port']
+  metadata = read_mbtiles_metadata(mbtiles_filepath)
+  map_html = make_folium_tile_map('/tiles/{z}/{x}/{y}.pbf', metadata).get_root().render().encode('utf-8')
+
+  class MBTilesHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+      if self.path in ['/', '/index.html']:
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(map_html)))
+        self.end_headers()
+        self.wfile.write(map_html)
+        return
+      match = TILE_URL_PATTERN.match(self.path)
+      if not match:
+        self.send_error(404)
+        return
+      db = sqlite3.connect(mbtiles_filepath)
+      tile = read_tile(db, *[int(i) for i in match.groups()])
+      db.close()
+      if not tile:
+        self.send_response(204)
+        self.end_headers()
+        return
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/x-protobuf')
+      self.send_header('Content-Encoding', 'gzip')
+      self.send_header('Content-Length', str(len(tile)))
+      self.end_headers()
+      self.wfile.write(tile)
+
+    def log_message(self, format, *args):
+      MAIN.LOG.debug(format % args)
+
+  server = http.server.ThreadingHTTPServer(('127.0.0.1', port), MBTilesHandler)
+  MAIN.LOG.info(f'Serving {mbtiles_filepath} at http://127.0.0.1:{port}/')
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('command', choices=['export', 'serve'])
+  parser.add_argument('--elevation-column', dest='elevation_column', default='average_comfy_days', required=False)
+  parser.add_argument('--color-scheme', dest='color_scheme', default='high_green', required=False)
+  parser.add_argument('--units', dest='units', default='days/year', required=False)
+  parser.add_argument('--mbtiles', dest='mbtiles_filepath', default=None, required=False)
+  parser.add_argument('--port', dest='port', type=int, default=None, required=False)
+  args = parser.parse_args()
+
+  climatefind.read_env()
+  climatefind.setup_logger()
+
+  mbtiles_filepath = args.mbtiles_filepath or get_mbtiles_filepath(args.elevation_column)
+  if args.command == 'export':
+    export_mbtiles(
+      elevation_column=args.elevation_column,
+      color_scheme=args.color_scheme,
+      units=args.units,
+      mbtiles_filepath=mbtiles_filepath,
+    )
+  else:
+    serve_mbtiles(mbtiles_filepath, port=args.port)
+
+if __name__ == "__main__":
+    main()
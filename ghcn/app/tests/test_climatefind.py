@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
 # Core
+import gzip
+import importlib.util
 import json
 import pprint
+import sqlite3
 import subprocess
 import os
 import time
@@ -10,6 +13,11 @@ import time
 # Contrib
 import yaml
 import folium
+import mapbox_vector_tile
+import matplotlib.image
+import numpy
+import pandas
+import scipy.interpolate
 
 # Custom
 import climatefind
@@ -161,6 +169,181 @@ def test_get_elevation_df_from_summary_csv():
   assert not climatefind.get_elevation_df_from_summary_csv().empty
   # print(climatefind.get_elevation_df_from_summary_csv(elevation_column='average_comfy_days'))
 
+def test_year_summary(tmp_path):
+  filepath = str(tmp_path / 'year.csv')
+  with open(filepath, 'w') as f:
+    f.write(',id,state,lat,lon,elev_m,average_comfy_days\n1,USC1,CO,37.35,-105.23,-3.0,100.5\n')
+  summary = climatefind.summary.get_year_summary(filepath)
+  assert summary is climatefind.summary.get_year_summary(filepath)
+  df = summary.columns(['lat', 'lon', 'state'])
+  assert df['lat'].dtype == numpy.float32
+  assert df['state'].dtype == 'category'
+  assert summary.column('average_comfy_days').iloc[0] == 100.5
+  assert summary.column('elev_m').iloc[0] == -3.0
+
+  # column() hands out the cached data, columns() a copy
+  assert numpy.shares_memory(summary.column('elev_m').to_numpy(), summary.column('elev_m').to_numpy())
+  df['lat'] = 0.0
+  assert summary.column('lat').iloc[0] == numpy.float32(37.35)
+
+  # Rewriting the file invalidates the cache
+  with open(filepath, 'w') as f:
+    f.write(',id,state,lat,lon,elev_m,average_comfy_days\n1,USC1,CO,37.35,-105.23,-3.0,200.5\n')
+  os.utime(filepath, ns=(0, os.stat(filepath).st_mtime_ns + 1))
+  assert summary.column('average_comfy_days').iloc[0] == 200.5
+
+def test_grid_summary_tiled(tmp_path):
+  rng = numpy.random.default_rng(0)
+  df = pandas.DataFrame({
+    'lon': rng.uniform(-124, -67, 300),
+    'lat': rng.uniform(25, 49, 300),
+    'elev': rng.uniform(0, 365, 300),
+  })
+  x_mesh, y_mesh, z_mesh = climatefind.grid_summary_df(df, num_points=90, sigma=(2, 1))
+  x_arr, y_arr, z_tiled = climatefind.grid.grid_summary_tiled(
+    df,
+    str(tmp_path / 'grid.npy'),
+    num_points=90,
+    sigma=(2, 1),
+    tile_px=32,
+    workers=2,
+  )
+  assert numpy.array_equal(x_arr, x_mesh[0])
+  assert numpy.array_equal(y_arr, y_mesh[:, 0])
+  assert numpy.allclose(z_tiled, z_mesh, equal_nan=True)
+  assert numpy.array_equal(climatefind.grid.load_grid(str(tmp_path / 'grid.npy'))[2], z_tiled, equal_nan=True)
+
+def test_preview_stratified_sample():
+  assert climatefind.preview.read_station_location(samples[1]['filepath']) == {
+    'filename': samples[1]['filename'],
+    'lat': 37.35,
+    'lon': -105.23,
+    'state': 'CO',
+  }
+  assert not climatefind.preview.read_station_location(samples[4]['filepath'])
+
+  rng = numpy.random.default_rng(0)
+  filenames = [f'USC{i:08d}.csv' for i in range(500)]
+  stations = pandas.DataFrame({
+    'filename': filenames,
+    'lat': rng.uniform(25, 49, 500),
+    'lon': rng.uniform(-124, -67, 500),
+    'hash': [climatefind.get_filename_hash(filename) for filename in filenames],
+  })
+  coarse = climatefind.preview.stratified_sample(stations, 8.0)
+  fine = climatefind.preview.stratified_sample(stations, 4.0)
+  assert len(coarse) < len(fine)
+  assert set(coarse) <= set(fine)
+  assert set(coarse) == set(climatefind.preview.stratified_sample(stations.sample(frac=1, random_state=1), 8.0))
+
+def test_sweep_thresholds():
+  env = climatefind.sweep.MAIN.ENV['comfy']
+  grid = climatefind.sweep.get_threshold_grid({
+    'tmax_solo_min': [env['tmax_solo']['min'], 5],
+    'tmax_solo_max': [env['tmax_solo']['max']],
+    'tmin_if_tmax_above_max': [env['tmin_if_tmax_above_max']],
+  })
+  day_index, tmax, tmin = climatefind.sweep.read_station_days(samples[1]['filepath'])
+  comfy = climatefind.sweep.is_comfy_day_grid(tmax, tmin, grid)
+  assert comfy.shape == (2, len(tmax))
+  total_comfy_days, average_comfy_days = climatefind.sweep.summarize_comfy_days(day_index, comfy)
+
+  # The first setting is env.yml's, so it matches the per-row version
+  year = climatefind.num_comfy_days_per_year_from_csv(climatefind.csv_from_temp_ghcn_file(samples[1]['filepath']))
+  assert total_comfy_days[0] == year['total_comfy_days']
+  assert average_comfy_days[0] == year['average_comfy_days']
+  assert total_comfy_days[1] >= total_comfy_days[0]
+
+def test_comfy_rule():
+  # The default rule is `is_comfy_day`
+  evaluate, columns = climatefind.rules.compile_rule(climatefind.rules.get_rule(climatefind.sweep.MAIN.ENV['comfy']))
+  assert columns == ['TMAX', 'TMIN']
+  tmax, tmin = [array.ravel() for array in numpy.meshgrid(numpy.arange(0, 30, 0.5), numpy.arange(0, 30, 0.5))]
+  assert evaluate({'TMAX': tmax, 'TMIN': tmin}).tolist() == [climatefind.is_comfy_day(a, b) for a, b in zip(tmax, tmin)]
+
+  evaluate, columns = climatefind.rules.compile_rule({
+    'all': [
+      {'column': 'TAVG', 'ge': 10},
+      {'not': {'column': 'PRCP', 'gt': 5}},
+    ]
+  })
+  assert columns == ['PRCP', 'TAVG']
+  data = {'TAVG': numpy.array([9, 10, 15, 15, 15]), 'PRCP': numpy.array([0, 0, 5, 5.1, numpy.nan])}
+  assert evaluate(data).tolist() == [False, True, True, False, False]
+
+  # Missing values fail ne too
+  evaluate, columns = climatefind.rules.compile_rule({'column': 'PRCP', 'ne': 0})
+  assert evaluate(data).tolist() == [False, False, True, True, False]
+
+  both = {'all': [{'column': 'TAVG', 'ge': 10}], 'any': [{'column': 'PRCP', 'le': 5}]}
+  for rule in [{'column': 'TOBS', 'gt': 1}, {'column': 'TMAX', 'gt': 1, 'lt': 2}, {'any': []}, both, [1]]:
+    try:
+      climatefind.rules.compile_rule(rule)
+      assert False
+    except ValueError:
+      pass
+
+  # A rule's columns are read with the file
+  env = climatefind.sweep.MAIN.ENV['comfy']
+  env['rule'] = {'all': [climatefind.rules.get_default_rule(env), {'column': 'PRCP', 'le': 5}]}
+  try:
+    csv = climatefind.csv_from_temp_ghcn_file(samples[1]['filepath'])
+    assert 'PRCP' in csv and 'SNWD' not in csv
+    year = climatefind.num_comfy_days_per_year_from_csv(csv)
+  finally:
+    env['rule'] = None
+  default_year = climatefind.num_comfy_days_per_year_from_csv(climatefind.csv_from_temp_ghcn_file(samples[1]['filepath']))
+  assert year[1]['comfy_days'][1]['tmax'] == default_year[1]['comfy_days'][1]['tmax']
+  assert year['average_comfy_days'] <= default_year['average_comfy_days']
+
+def test_pierce_set():
+  # The TMY3 pipeline's comfPierceSETArray gives the same
+  ta = numpy.array([-10.0, 0.0, 15.0, 25.0, 35.0])
+  rh = numpy.array([80.0, 60.0, 50.0, 50.0, 30.0])
+  assert climatefind.comfort.pierce_set(ta, ta, 1.0, rh, 3.01, 0.4, 0).round(2).tolist() == [-5.79, 3.42, 17.74, 26.33, 32.26]
+  assert climatefind.comfort.pierce_set(ta, ta, 1.0, rh, 5.01, 0.8, 0).round(2).tolist() == [15.85, 23.73, 31.1, 36.05, 39.61]
+  assert isinstance(climatefind.comfort.pierce_set(25.0, 25.0, 1.0, 50, 3.01, 0.4, 0), float)
+
+def test_pierce_set_matches_tmy3():
+  # comfort.py is a copy of the TMY3 pipeline's model, loaded here straight from its file
+  spec = importlib.util.spec_from_file_location(
+    'tmy3_comfort_models', os.path.join(GHCN_DIR, '..', 'tmy3', 'comfort_models', 'comfort_models.py'))
+  comfort_models = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(comfort_models)
+
+  rng = numpy.random.default_rng(0)
+  ta = rng.uniform(-40, 50, 5000)
+  tr = ta + rng.uniform(-10, 10, 5000)
+  vel = rng.uniform(0, 10, 5000)
+  rh = rng.uniform(0, 100, 5000)
+  for met, clo in ((3.01, 0.4), (5.01, 0.8), (1.0, 0.5)):
+    assert numpy.array_equal(
+      climatefind.comfort.pierce_set(ta, tr, vel, rh, met, clo, 0),
+      comfort_models.comfPierceSETArray(ta, tr, vel, rh, met, clo, 0),
+      equal_nan=True,
+    )
+
+def test_hourly_comfy_hours():
+  env = climatefind.sweep.MAIN.ENV['hourly']
+  tmax = numpy.array([22.0, -5.0, 35.0])
+  tmin = numpy.array([10.0, -15.0, 24.0])
+  ta = climatefind.hourly.synthesize_hours(tmax, tmin, env['tmin_hour'], env['tmax_hour'])
+  assert ta.shape == (3, 24)
+  assert ta[:, env['tmin_hour']].tolist() == tmin.tolist()
+  assert ta[:, env['tmax_hour']].tolist() == tmax.tolist()
+  assert (ta.min(axis=1) == tmin).all() and (ta.max(axis=1) == tmax).all()
+  assert climatefind.hourly.relative_humidity(numpy.array([10.0, 20.0]), numpy.array([10.0, 10.0])).round(1).tolist() == [100.0, 52.5]
+
+  # A mild day has comfy hours, in the window only; a freezing day and a muggy day have none
+  comfy = climatefind.hourly.get_comfy_hours(tmax, tmin)
+  assert comfy.shape == (3, 24)
+  assert comfy[0].sum() >= env['min_comfy_hours']
+  assert not comfy[0, :env['earliest_hour']].any() and not comfy[0, env['latest_hour'] + 1:].any()
+  assert not comfy[1:].any()
+
+  day_index, tmax, tmin = climatefind.sweep.read_station_days(samples[1]['filepath'])
+  assert climatefind.hourly.get_comfy_hours(tmax, tmin).shape == (len(tmax), 24)
+
 def test_scale_onto_array():
   assert climatefind.scale_onto_array(
     vmin=0,
@@ -192,6 +375,103 @@ def test_make_folium_elevation_map():
   # for month_num, month in climatefind.CALENDAR.items():
   #   assert climatefind.make_folium_elevation_map(elevation_column=f'''{month['name']}_percent_comfy''', color_scheme='high_green', units='% comfy')
 
+def test_tile_range():
+  minx, miny, maxx, maxy = climatefind.tiles.tile_bounds(zoom=5, x=7, y=12)
+  x_range, y_range = climatefind.tiles.tile_range((minx + 1, miny + 1, maxx - 1, maxy - 1), zoom=5)
+  assert list(x_range) == [7]
+  assert list(y_range) == [12]
+  x, y = climatefind.tiles.lonlat_to_mercator(samples[1]['meta']['lon'], samples[1]['meta']['lat'])
+  x_range, y_range = climatefind.tiles.tile_range((x, y, x, y), zoom=5)
+  assert list(x_range) == [6] and list(y_range) == [12]  # Trinchera, CO
+
+def test_export_mbtiles(tmp_path):
+  # Bins at zoom 3 and stations at zoom 4 keep the pyramid small
+  tiles_env = climatefind.tiles.MAIN.ENV['tiles']
+  binning_env = climatefind.tiles.MAIN.ENV['binning']
+  saved = (dict(tiles_env), dict(binning_env))
+  tiles_env.update({'min_zoom': 3, 'max_zoom': 4})
+  binning_env['station_zoom'] = 4
+  try:
+    mbtiles_filepath = climatefind.tiles.export_mbtiles(
+      elevation_column='aug_1_tmax', color_scheme='high_red', units='C', mbtiles_filepath=str(tmp_path / 'aug_1_tmax.mbtiles'))
+  finally:
+    tiles_env.update(saved[0])
+    binning_env.update(saved[1])
+
+  metadata = climatefind.tiles.read_mbtiles_metadata(mbtiles_filepath)
+  assert (metadata['name'], metadata['minzoom'], metadata['maxzoom']) == ('aug_1_tmax', '3', '4')
+
+  # Read back the tiles holding the first station
+  station = climatefind.get_elevation_df_from_summary_csv('aug_1_tmax').iloc[0]
+  x, y = climatefind.tiles.lonlat_to_mercator(station['lon'], station['lat'])
+  db = sqlite3.connect(mbtiles_filepath)
+  try:
+    decoded = {}
+    for zoom in (3, 4):
+      x_range, y_range = climatefind.tiles.tile_range((x, y, x, y), zoom)
+      decoded[zoom] = mapbox_vector_tile.decode(gzip.decompress(climatefind.tiles.read_tile(db, zoom, x_range[0], y_range[0])))
+  finally:
+    db.close()
+  assert decoded[3]['contours']['features'] and decoded[3]['bins']['features']
+  assert 'stations' not in decoded[3] or not decoded[3]['stations']['features']
+  assert decoded[4]['contours']['features']
+  assert 'bins' not in decoded[4] or not decoded[4]['bins']['features']
+  assert decoded[4]['stations']['features'][0]['geometry']['type'] == 'Point'
+  assert {'id', 'name', 'value', 'tooltip', 'color'} <= set(decoded[4]['stations']['features'][0]['properties'])
+
+def test_render_interpolation_matches_griddata():
+  rng = numpy.random.default_rng(0)
+  lon = rng.uniform(-120, -70, 200)
+  lat = rng.uniform(25, 49, 200)
+  values = rng.uniform(0, 365, 200)
+  lon_mesh, lat_mesh = climatefind.render.make_pixel_mesh((-125, 24, -66, 50), 64, 32)
+  vertices, weights, outside = climatefind.render.get_interpolation_weights(lon, lat, lon_mesh, lat_mesh)
+  surface = numpy.einsum('ij,ij->i', values[vertices], weights)
+  surface[outside] = numpy.nan
+  expected = scipy.interpolate.griddata((lon, lat), values, (lon_mesh, lat_mesh), method='linear').ravel()
+  assert numpy.allclose(surface, expected, equal_nan=True)
+
+def test_render_pngs(tmp_path):
+  rng = numpy.random.default_rng(0)
+  columns = climatefind.render.get_render_columns()
+  df = pandas.DataFrame({'lat': rng.uniform(25, 49, 50), 'lon': rng.uniform(-120, -70, 50)})
+  for column in columns:
+    df[column] = rng.uniform(0, 100, 50)
+  summary_filepath = str(tmp_path / 'year.csv')
+  df.to_csv(summary_filepath)
+
+  png_filepaths = climatefind.render.render_pngs(
+    output_dir=str(tmp_path / 'img'),
+    bbox=(-125, 24, -66, 50),
+    width=64,
+    height=32,
+    summary_filepath=summary_filepath,
+  )
+  assert sorted(os.path.basename(filepath) for filepath in png_filepaths) == sorted(f'{name}.png' for name, scheme in columns.values())
+  image = matplotlib.image.imread(png_filepaths[0])
+  assert image.shape == (32, 64, 4)
+  # Background outside the stations' hull, colors inside it
+  assert numpy.all(image[0, 0] == 1.0)
+  assert not numpy.all(image[16, 32] == 1.0)
+
+def test_bin_values():
+  rng = numpy.random.default_rng(0)
+  x = rng.uniform(-1000, 1000, 5000)
+  y = rng.uniform(-1000, 1000, 5000)
+  values = rng.uniform(0, 365, 5000)
+  for kind in ['hex', 'square']:
+    bins = climatefind.binning.bin_values(x, y, values, size=100, kind=kind)
+    assert bins['count'].sum() == 5000
+    assert numpy.isclose((bins['mean'] * bins['count']).sum(), values.sum())
+    assert (bins['min'] <= bins['mean']).all() and (bins['mean'] <= bins['max']).all()
+  # Every point lands in the hexagon whose center is nearest to it
+  q, r = climatefind.binning.hex_bin_keys(x, y, 100)
+  center_x, center_y = climatefind.binning.hex_bin_centers(q, r, 100)
+  distance = numpy.hypot(x - center_x, y - center_y)
+  for dq, dr in [(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)]:
+    neighbor_x, neighbor_y = climatefind.binning.hex_bin_centers(q + dq, r + dr, 100)
+    assert (distance <= numpy.hypot(x - neighbor_x, y - neighbor_y) + 1e-9).all()
+
 ## 256 batches
 # def test_main_fast():
 #   procs = []
@@ -0,0 +1,180 @@
+import os
+import json
+import hashlib
+import inspect
+import logging
+import numpy
+import comfort_models
+
+
+log = logging.getLogger('main')
+
+# Bounds already loaded or built by this process, by cache key
+COMFORT_BOUNDS = {}
+
+
+def find_crossings(met, clo, desired_set, ta_axis, rh, vel, iterations=30):
+  """
+  For each (rh, vel), the air temperature where SET (with tr = ta) crosses
+  `desired_set`, found by scanning `ta_axis` and bisecting the bracketing
+  step.
+
+  Returns the crossing temperature, -inf if SET is above `desired_set`
+  over the whole scan, +inf if it's below, and NaN if it crosses more than
+  once or the model fails, since then no single bound separates the two.
+  """
+  ta = ta_axis[:, numpy.newaxis]
+  values = comfort_models.comfPierceSETArray(ta, ta, vel, rh, met, clo, 0) - desired_set
+  above = values > 0
+  crossings = numpy.count_nonzero(above[1:] != above[:-1], axis=0)
+
+  # Bisect the step where SET goes from below to above
+  step = numpy.argmax(above[1:] & ~above[:-1], axis=0)
+  low = ta_axis[step]
+  high = ta_axis[step + 1]
+  for i in range(iterations):
+    middle = (low + high) / 2
+    middle_above = comfort_models.comfPierceSETArray(middle, middle, vel, rh, met, clo, 0) > desired_set
+    high = numpy.where(middle_above, middle, high)
+    low = numpy.where(middle_above, low, middle)
+  bound = (low + high) / 2
+
+  bound = numpy.where(crossings == 0, numpy.where(above[0], -numpy.inf, numpy.inf), bound)
+  bound[(crossings > 1) | numpy.isnan(values).any(axis=0) | (above[0] & (crossings == 1))] = numpy.nan
+  return bound
+
+
+class ComfortBounds(object):
+  """
+  Air temperature bounds of the comfy range for a (rh, vel) grid.
+
+  An hour is comfy when the desired SET lies between the SET dressed cool
+  walking slow and the SET dressed warm walking fast. Each SET crosses the
+  desired SET once as the air warms, so that is the same as the air
+  temperature lying between `lower` (where the warm case reaches the desired
+  SET) and `upper` (where the cool case does).
+
+  The bounds are kept per grid cell as the smallest and largest of the
+  cell's corners and center, so an hour anywhere in the cell is only
+  classified when it is clear of every bound in the cell by `margin`.
+  """
+  def __init__(self, ta_axis, rh_axis, vel_axis, lower_min, lower_max, upper_min, upper_max):
+    self.ta_axis = ta_axis
+    self.axes = (rh_axis, vel_axis)
+    self.lower_min = lower_min
+    self.lower_max = lower_max
+    self.upper_min = upper_min
+    self.upper_max = upper_max
+
+  @classmethod
+  def build(cls, desired_set, cool, warm, ta_axis, rh_axis, vel_axis):
+    """
+    :param cool: (met, clo) of the dressed cool, walking slow case
+    :param warm: (met, clo) of the dressed warm, walking fast case
+    """
+    rh_centers = (rh_axis[:-1] + rh_axis[1:]) / 2
+    vel_centers = (vel_axis[:-1] + vel_axis[1:]) / 2
+    rh, vel = numpy.meshgrid(rh_axis, vel_axis, indexing='ij')
+    rh_center, vel_center = numpy.meshgrid(rh_centers, vel_centers, indexing='ij')
+
+    envelopes = []
+    for met, clo in (warm, cool):
+      corners = find_crossings(met, clo, desired_set, ta_axis, rh.ravel(), vel.ravel()).reshape(rh.shape)
+      centers = find_crossings(met, clo, desired_set, ta_axis, rh_center.ravel(), vel_center.ravel()).reshape(rh_center.shape)
+      # NaN anywhere in the cell makes the whole cell NaN
+      cell = numpy.stack([corners[:-1, :-1], corners[1:, :-1], corners[:-1, 1:], corners[1:, 1:], centers])
+      envelopes.append((cell.min(axis=0), cell.max(axis=0)))
+
+    (lower_min, lower_max), (upper_min, upper_max) = envelopes
+    return cls(ta_axis, rh_axis, vel_axis, lower_min, lower_max, upper_min, upper_max)
+
+  @classmethod
+  def load(cls, filepath):
+    with numpy.load(filepath) as npz:
+      return cls(
+        npz['ta_axis'],
+        npz['rh_axis'],
+        npz['vel_axis'],
+        npz['lower_min'],
+        npz['lower_max'],
+        npz['upper_min'],
+        npz['upper_max'],
+      )
+
+  def save(self, filepath):
+    numpy.savez(
+      filepath,
+      ta_axis=self.ta_axis,
+      rh_axis=self.axes[0],
+      vel_axis=self.axes[1],
+      lower_min=self.lower_min,
+      lower_max=self.lower_max,
+      upper_min=self.upper_min,
+      upper_max=self.upper_max,
+    )
+
+  def classify(self, ta, rh, vel, margin):
+    """
+    Returns (comfy, decided) boolean arrays. Hours that aren't decided are
+    within `margin` of a bound, outside the grid (or the temperatures the
+    bounds were searched over) or in a cell with no clean bound, and need the
+    comfort model.
+    """
+    # comfPierceSET doesn't distinguish air speeds below 0.1 m/s
+    ta, rh, vel = numpy.broadcast_arrays(
+      numpy.asarray(ta, dtype=numpy.float64),
+      numpy.asarray(rh, dtype=numpy.float64),
+      numpy.maximum(numpy.asarray(vel, dtype=numpy.float64), 0.1),
+    )
+    cell = []
+    outside = ~((ta >= self.ta_axis[0]) & (ta <= self.ta_axis[-1]))
+    for axis, x in zip(self.axes, (rh, vel)):
+      position = (x - axis[0]) / (axis[1] - axis[0])
+      outside |= ~((position >= 0) & (position <= len(axis) - 1))
+      cell.append(numpy.clip(numpy.floor(numpy.nan_to_num(position)), 0, len(axis) - 2).astype(numpy.intp))
+    cell = tuple(cell)
+
+    lower_min = self.lower_min[cell]
+    lower_max = self.lower_max[cell]
+    upper_min = self.upper_min[cell]
+    upper_max = self.upper_max[cell]
+    comfy = (ta >= lower_max + margin) & (ta <= upper_min - margin)
+    not_comfy = (ta < lower_min - margin) | (ta > upper_max + margin)
+    decided = (comfy | not_comfy) & ~outside & ~numpy.isnan(lower_min) & ~numpy.isnan(upper_min)
+    return comfy & decided, decided
+
+
+def get_cache_key(desired_set, cool, warm, ta_axis, rh_axis, vel_axis):
+  key = json.dumps({
+    'desired_set': float(desired_set),
+    'cool': [float(x) for x in cool],
+    'warm': [float(x) for x in warm],
+    'ta_axis': [float(x) for x in ta_axis],
+    'rh_axis': [float(x) for x in rh_axis],
+    'vel_axis': [float(x) for x in vel_axis],
+    'model': inspect.getsource(comfort_models.comfPierceSETArray),
+    'bounds': inspect.getsource(find_crossings),
+  }, sort_keys=True)
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_comfort_bounds(desired_set, cool, warm, ta_axis, rh_axis, vel_axis, cache_dir):
+  """
+  Load the comfort bounds from `cache_dir`, building and saving them on
+  first use
+  """
+  key = get_cache_key(desired_set, cool, warm, ta_axis, rh_axis, vel_axis)
+  if key in COMFORT_BOUNDS:
+    return COMFORT_BOUNDS[key]
+
+  filepath = os.path.join(cache_dir, f'comfort_bounds_{key}.npz')
+  if os.path.exists(filepath):
+    bounds = ComfortBounds.load(filepath)
+  else:
+    log.info(f'building comfort bounds for SET {desired_set}')
+    bounds = ComfortBounds.build(desired_set, cool, warm, ta_axis, rh_axis, vel_axis)
+    os.makedirs(cache_dir, exist_ok=True)
+    bounds.save(filepath)
+    log.info(f'saved comfort bounds to {filepath}')
+  COMFORT_BOUNDS[key] = bounds
+  return bounds
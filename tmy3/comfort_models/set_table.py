@@ -0,0 +1,283 @@
+import os
+import json
+import hashlib
+import inspect
+import logging
+import numpy
+from . import comfort_models
+
+
+log = logging.getLogger('main')
+
+# Tables already loaded or built by this process, by cache key
+SET_TABLES = {}
+
+# A cell error this big (C) is SET jumping between two solutions, not interpolation error
+JUMP_ERROR = 0.5
+
+
+def get_axis(start, stop, num):
+  return numpy.linspace(start, stop, int(num))
+
+
+def get_log_axis(start, stop, num):
+  """
+  Like get_axis, but evenly spaced in log(x), e.g. for air speeds where SET
+  changes fastest at the low end
+  """
+  return numpy.geomspace(start, stop, int(num))
+
+
+class SetTable(object):
+  """
+  Standard Effective Temperature for one (met, clo) pair, precomputed on a
+  (ta, rh, vel) grid with tr = ta and wme = 0 like comfy() uses. The grid is
+  regular in ta, rh and log(vel) (see get_log_axis), and interpolation is
+  linear in those.
+
+  `cell_error` is the largest difference between the interpolated and the
+  exact SET found in each grid cell: on a lattice `subdivisions` times finer
+  than the grid (edge midpoints, face and cell centers for 2) and at
+  `interior_samples` random points inside the cell. It is measured, not
+  proven: SET can jump between two solutions somewhere no sample lands, so
+  callers scale it by a safety margin (see `set()`). Cells where the exact
+  model fails at a sample get an infinite error.
+
+  Those jumps happen in a band of SET values (around 27-36 C, where sweating
+  sets in), and a cell can hide one that no sample found, so `jump_band` is
+  the range of the corner values of every cell with an error of at least
+  JUMP_ERROR (NaN if there are none).
+  """
+  def __init__(self, met, clo, ta_axis, rh_axis, vel_axis, values, cell_error, jump_band=(numpy.nan, numpy.nan)):
+    self.met = met
+    self.clo = clo
+    self.axes = (ta_axis, rh_axis, vel_axis)
+    # The axes interpolation is linear in
+    self.grid_axes = (ta_axis, rh_axis, numpy.log(vel_axis))
+    for axis, grid_axis in zip(self.axes, self.grid_axes):
+      if not numpy.allclose(numpy.diff(grid_axis), grid_axis[1] - grid_axis[0]):
+        raise ValueError(f'SET table axis {axis} must be evenly spaced (in log(vel) for air speeds)')
+    self.values = values
+    self.cell_error = cell_error
+    self.jump_band = numpy.asarray(jump_band, dtype=numpy.float64)
+    self._corners = None
+
+  @property
+  def max_error(self):
+    """
+    Largest finite cell error
+    """
+    return float(numpy.max(self.cell_error[numpy.isfinite(self.cell_error)], initial=0))
+
+  @classmethod
+  def build(cls, met, clo, ta_axis, rh_axis, vel_axis, subdivisions=2, interior_samples=2, seed=0):
+    ta, rh, vel = numpy.meshgrid(ta_axis, rh_axis, vel_axis, indexing='ij')
+    table = cls(met, clo, ta_axis, rh_axis, vel_axis, table_set(ta, rh, vel, met, clo).astype(numpy.float32), None)
+
+    # Error on the finer lattice, then the largest over each cell's part of it
+    fine_axes = [numpy.linspace(axis[0], axis[-1], (len(axis) - 1) * subdivisions + 1) for axis in table.grid_axes]
+    fine_error = numpy.empty([len(axis) for axis in fine_axes])
+    slab = max(1, 100000 // fine_error[0].size)
+    for start in range(0, len(fine_axes[0]), slab):
+      ta, rh, log_vel = numpy.meshgrid(fine_axes[0][start:start + slab], *fine_axes[1:], indexing='ij')
+      fine_error[start:start + slab] = table.interpolation_error(ta, rh, numpy.exp(log_vel))
+    cell_error = fine_error
+    for dim in range(3):
+      cell_error = numpy.moveaxis(cell_error, dim, 0)
+      cell_error = numpy.max([cell_error[offset::subdivisions][:len(fine_axes[dim]) // subdivisions] for offset in range(subdivisions + 1)], axis=0)
+      cell_error = numpy.moveaxis(cell_error, 0, dim)
+
+    # And at random points inside each cell
+    rng = numpy.random.default_rng(seed)
+    cells = numpy.meshgrid(*[numpy.arange(len(axis) - 1) for axis in table.grid_axes], indexing='ij')
+    for sample in range(interior_samples):
+      ta, rh, log_vel = [axis[0] + (cell + rng.random(cell.shape)) * (axis[1] - axis[0]) for axis, cell in zip(table.grid_axes, cells)]
+      cell_error = numpy.maximum(cell_error, table.interpolation_error(ta, rh, numpy.exp(log_vel)))
+
+    table.cell_error = cell_error
+    jumps = numpy.nonzero(numpy.isfinite(cell_error) & (cell_error >= JUMP_ERROR))
+    if len(jumps[0]):
+      corners = [table.values[tuple(lower + ((corner >> dim) & 1) for dim, lower in enumerate(jumps))] for corner in range(8)]
+      table.jump_band = numpy.array([numpy.nanmin(corners), numpy.nanmax(corners)])
+    return table
+
+  def interpolation_error(self, ta, rh, vel):
+    """
+    :return: abs(interpolated - exact SET), infinite where either is NaN
+    """
+    error = numpy.abs(self.interpolate(ta, rh, vel) - table_set(ta, rh, vel, self.met, self.clo))
+    return numpy.where(numpy.isnan(error), numpy.inf, error)
+
+  @classmethod
+  def load(cls, filepath):
+    with numpy.load(filepath) as npz:
+      return cls(
+        float(npz['met']),
+        float(npz['clo']),
+        npz['ta_axis'],
+        npz['rh_axis'],
+        npz['vel_axis'],
+        npz['values'],
+        npz['cell_error'],
+        npz['jump_band'],
+      )
+
+  def save(self, filepath):
+    numpy.savez_compressed(
+      filepath,
+      met=self.met,
+      clo=self.clo,
+      ta_axis=self.axes[0],
+      rh_axis=self.axes[1],
+      vel_axis=self.axes[2],
+      values=self.values,
+      cell_error=self.cell_error,
+      jump_band=self.jump_band,
+    )
+
+  @property
+  def corners(self):
+    """
+    The 8 corner values of every grid cell in one row, by the cell's flat
+    index, so interpolating needs one lookup per point. Single precision
+    (like `values`) halves the memory each lookup touches; cell_error is
+    measured through interpolate() so includes the rounding.
+    """
+    if self._corners is None:
+      cells = [len(axis) - 1 for axis in self.grid_axes]
+      self._corners = numpy.stack([
+        self.values[i:i + cells[0], j:j + cells[1], k:k + cells[2]] for i in (0, 1) for j in (0, 1) for k in (0, 1)
+      ], axis=-1).reshape(-1, 8).astype(numpy.float32, copy=False)
+    return self._corners
+
+  def locate(self, ta, rh, vel):
+    """
+    :return: Flat index of the grid cell each point falls in, the fraction of
+      the way across it along each axis, and whether each point is outside
+      the grid
+    """
+    # comfPierceSET doesn't distinguish air speeds below 0.1 m/s
+    points = numpy.broadcast_arrays(
+      numpy.asarray(ta, dtype=numpy.float64),
+      numpy.asarray(rh, dtype=numpy.float64),
+      numpy.log(numpy.maximum(numpy.asarray(vel, dtype=numpy.float64), 0.1)),
+    )
+    cell = 0
+    fraction = []
+    outside = numpy.zeros(points[0].shape, dtype=bool)
+    for axis, x in zip(self.grid_axes, points):
+      position = (x - axis[0]) * (1 / (axis[1] - axis[0]))
+      # Only check each point when some are off the grid (or NaN)
+      if not (position.min(initial=0) >= 0 and position.max(initial=0) <= len(axis) - 1):
+        outside |= ~((position >= 0) & (position <= len(axis) - 1))
+        position = numpy.clip(numpy.nan_to_num(position), 0, len(axis) - 1)
+      # The last grid point is the top of the last cell
+      i = numpy.minimum(position.astype(numpy.intp), len(axis) - 2)
+      cell = cell * (len(axis) - 1) + i
+      fraction.append(position - i)
+    return cell, fraction, outside
+
+  def interpolate(self, ta, rh, vel):
+    """
+    Multilinear interpolation of SET, NaN outside the grid
+    """
+    cell, fraction, outside = self.locate(ta, rh, vel)
+    # One contiguous row per corner, halved along each axis in turn
+    value = self.corners.take(cell.ravel(), axis=0).T.copy()
+    for f in fraction[::-1]:
+      f = f.ravel().astype(numpy.float32)
+      value = value[::2] + f * (value[1::2] - value[::2])
+    result = value[0].astype(numpy.float64).reshape(outside.shape)
+    if outside.any():
+      result = numpy.where(outside, numpy.nan, result)
+    return result[()]
+
+  def error(self, ta, rh, vel):
+    """
+    Measured interpolation error of the grid cell each point falls in, NaN
+    outside the grid
+    """
+    cell, fraction, outside = self.locate(ta, rh, vel)
+    return numpy.where(outside, numpy.nan, self.cell_error.ravel()[cell])[()]
+
+  def set(self, ta, rh, vel, threshold=None, margin=1.0, min_margin=0.0):
+    """
+    SET from the table, recalculated exactly wherever the table can't be
+    trusted: outside the grid, next to grid points the model failed at, and
+    within `margin` times the cell's measured error, or `min_margin` (C) if
+    that is more, of `threshold`, and anywhere in `jump_band` when
+    `threshold` is in it, so comparing the result with `threshold` gives the
+    same answer as the exact model.
+
+    Like comfPierceSETArray, NaN where the exact model fails.
+    """
+    shape = numpy.broadcast(ta, rh, vel).shape
+    ta, rh, vel = [x.ravel() for x in numpy.broadcast_arrays(
+      numpy.asarray(ta, dtype=numpy.float64),
+      numpy.asarray(rh, dtype=numpy.float64),
+      numpy.asarray(vel, dtype=numpy.float64),
+    )]
+    values = self.interpolate(ta, rh, vel)
+    exact = numpy.isnan(values)
+    if threshold is not None:
+      exact |= ~(numpy.abs(values - threshold) > numpy.maximum(margin * self.error(ta, rh, vel), min_margin))
+      lowest, highest = self.jump_band + [-min_margin, min_margin]
+      if lowest <= threshold <= highest:
+        exact |= (values >= lowest) & (values <= highest)
+    if exact.any():
+      values[exact] = comfort_models.comfPierceSETArray(ta[exact], ta[exact], vel[exact], rh[exact], self.met, self.clo, 0)
+    return values.reshape(shape)[()]
+
+
+def table_set(ta, rh, vel, met, clo, chunk=100000):
+  """
+  comfPierceSETArray with tr = ta and wme = 0, a chunk at a time to bound
+  its memory on big grids
+  """
+  ta, rh, vel = numpy.broadcast_arrays(ta, rh, vel)
+  result = numpy.empty(ta.shape)
+  for start in range(0, ta.size, chunk):
+    part = slice(start, start + chunk)
+    result.flat[part] = comfort_models.comfPierceSETArray(ta.flat[part], ta.flat[part], vel.flat[part], rh.flat[part], met, clo, 0)
+  return result
+
+
+def get_cache_key(met, clo, ta_axis, rh_axis, vel_axis):
+  """
+  Hash of everything the table depends on, including the comfort model's
+  and the error measurement's source so a change to either never reuses a
+  stale table
+  """
+  key = json.dumps({
+    'met': float(met),
+    'clo': float(clo),
+    'wme': 0,
+    'ta_axis': [float(x) for x in ta_axis],
+    'rh_axis': [float(x) for x in rh_axis],
+    'vel_axis': [float(x) for x in vel_axis],
+    'model': inspect.getsource(comfort_models.comfPierceSETArray),
+    'cell_error': inspect.getsource(SetTable.build),
+  }, sort_keys=True)
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_set_table(met, clo, ta_axis, rh_axis, vel_axis, cache_dir):
+  """
+  Load the SET table for (met, clo) from `cache_dir`, building and saving it
+  on first use
+  """
+  key = get_cache_key(met, clo, ta_axis, rh_axis, vel_axis)
+  if key in SET_TABLES:
+    return SET_TABLES[key]
+
+  filepath = os.path.join(cache_dir, f'set_table_{key}.npz')
+  if os.path.exists(filepath):
+    table = SetTable.load(filepath)
+  else:
+    log.info(f'building SET table for met={met}, clo={clo}')
+    table = SetTable.build(met, clo, ta_axis, rh_axis, vel_axis)
+    os.makedirs(cache_dir, exist_ok=True)
+    table.save(filepath)
+    log.info(f'saved SET table to {filepath} (max interpolation error {table.max_error:.4f} C)')
+  SET_TABLES[key] = table
+  return table
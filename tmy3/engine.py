@@ -0,0 +1,689 @@
+"""
+The TMY3 comfyness pipeline as plain functions, with no side effects on
+import:
+
+  load_config -> parse_station -> evaluate_hours -> aggregate_days -> report_row
+
+process_station runs the stages for one file and run_stations fans files out
+over a process pool. Every stage takes the loaded config as its first
+argument.
+
+The hourly comfy flags can be kept as bitsets (save_comfy_hours) so the
+days and months can be counted again for other thresholds (reaggregate)
+without the comfort model.
+"""
+import os
+import re
+import csv
+import glob
+import ntpath
+import logging
+import calendar
+import json
+import functools
+import collections
+import concurrent.futures
+import yaml
+import numpy
+import pandas
+import comfort_models
+from comfort_models import set_table
+import comfort_bounds
+
+
+log = logging.getLogger('main')
+
+CONFIG_YAML_FILE_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
+
+# Columns the comfort calculation reads from each TMY3 file
+STATION_COLUMNS = [
+  'etr_w_m2',
+  'dry_bulb_c',
+  'dew_point_c',
+  'rhum_percent',
+  'wspd_m_s',
+  'lprecip_depth_mm',
+]
+
+REPORT_COLUMNS = (
+  ['comfy_days_in_year', 'comfy_months_in_year', 'comfy_days_in_year_percent', 'comfy_months_in_year_percent'] +
+  [f'month_{x}_%' for x in range(1,13)]
+)
+
+# One TMY3 file, laid out as 365 days of 24 hours
+Station = collections.namedtuple('Station', ['file_code', 'meta_header', 'station_meta', 'hours', 'month_of_day'])
+
+# Settings a comfort profile sweep can vary between profiles
+PROFILE_KEYS = (
+  'MIN_METABOLIC_RATE',
+  'MAX_METABOLIC_RATE',
+  'MIN_CLOTHING_RATING',
+  'MAX_CLOTHING_RATING',
+  'DESIRED_STANDARD_EFFECTIVE_TEMPERATURE',
+  'MIN_COMFY_HOURS',
+  'MIN_COMFY_DAYS_PER_MONTH_PERCENT',
+)
+
+# One station's comfy hours, packed 8 to a byte in day then hour order
+ComfyHours = collections.namedtuple('ComfyHours', ['station_meta', 'month_of_day', 'bits'])
+
+
+## Configuration
+################
+def load_config(path=CONFIG_YAML_FILE_DEFAULT_PATH):
+  try:
+    with open(path, 'r') as config_yaml_file:
+      config = yaml.safe_load(config_yaml_file)
+  except FileNotFoundError:
+    raise FileNotFoundError(str('could not load file: {path}'.format(path=path)))
+  config['CONFIG_DIR'] = os.path.dirname(os.path.abspath(path))
+  return config
+
+
+def get_path(config, path):
+  """
+  Paths in the config are relative to the config file
+  """
+  return os.path.join(config['CONFIG_DIR'], path)
+
+
+def get_station_files(config):
+  return sorted(glob.glob(get_path(config, config[config['MODE']])))[:config['MAX_FILES']]
+
+
+## Parse
+########
+@functools.lru_cache(maxsize=None)
+def compile_column_replacements(replacements):
+  """
+  Compiled once per set of replacements rather than for every file
+  """
+  replacements = dict((re.escape(k), v) for k, v in replacements)
+  return replacements, re.compile("|".join(replacements.keys()))
+
+
+def simplify_column_name(config, column):
+  replacements, pattern = compile_column_replacements(tuple(config['COLUMS_REPLACEMENT_DICTIONARY'].items()))
+  return (pattern.sub(lambda m: replacements[re.escape(m.group(0))], column)).lower()
+
+
+def read_station_file(config, sample_file):
+  """
+  Read a TMY3 file in one pass: the station meta line, the column header and
+  only the STATION_COLUMNS of the data, as float32.
+
+  Returns (meta_header, station_meta, datafile). datafile has a date_time
+  column built from the date and time columns.
+  """
+  with open(sample_file, 'r', newline='') as f:
+    meta_line = f.readline()
+    column_header = next(csv.reader([f.readline()]))
+    simplified_column_names = [simplify_column_name(config, column) for column in column_header]
+    datafile = pandas.read_csv(
+      f,
+      header=None,
+      names=simplified_column_names,
+      usecols=[0, 1] + [simplified_column_names.index(column) for column in STATION_COLUMNS],
+      dtype=dict([(simplified_column_names[0], str), (simplified_column_names[1], str)] + [(column, numpy.float32) for column in STATION_COLUMNS]),
+    )
+
+  meta_header = {}
+  station_meta = []
+  for column, value in zip(config['META_HEADER_ROWS'], next(csv.reader([meta_line]))):
+    meta_header[column] = value
+    try:
+      station_meta.append(round(float(value),3))
+    except ValueError:
+      station_meta.append(value)
+
+  # Move the hour back one so 24:00 parses. Also, because the records all
+  # **end** at the time listed (they are for the previous hour), this makes
+  # all observations for the **next** hour.  Example: a reading at 0800 local
+  # is for the 0800-0900 hour.
+  date_column = datafile.pop(simplified_column_names[0])
+  time_column = datafile.pop(simplified_column_names[1])
+  datafile.insert(0, 'date_time', pandas.to_datetime(date_column, format='%m/%d/%Y') + pandas.to_timedelta(time_column.str[0:2].astype(int) - 1, unit='h'))
+
+  return meta_header, station_meta, datafile
+
+
+def parse_station(config, sample_file):
+  """
+  Returns the Station in `sample_file`. Raises ValueError if it isn't a
+  whole year of hours.
+  """
+  meta_header, station_meta, datafile = read_station_file(config, sample_file)
+  file_code = str(ntpath.basename(sample_file)[:-4])
+  log.debug(str(datafile.size))
+
+  # A TMY3 year is always 365 days of 24 hours in calendar order
+  if len(datafile) != 365 * 24:
+    raise ValueError(f'{file_code} has {len(datafile)} hours instead of {365 * 24}')
+  return Station(
+    file_code=file_code,
+    meta_header=meta_header,
+    station_meta=station_meta,
+    hours={
+      column: datafile[column].to_numpy().reshape(365, 24)
+      for column in STATION_COLUMNS
+    },
+    month_of_day=datafile['date_time'].dt.month.to_numpy()[::24],
+  )
+
+
+## Evaluate
+###########
+def get_set_table(config, met, clo):
+  return set_table.get_set_table(
+    met=met,
+    clo=clo,
+    ta_axis=set_table.get_axis(*config['SET_TABLE_TA']),
+    rh_axis=set_table.get_axis(*config['SET_TABLE_RH']),
+    vel_axis=set_table.get_log_axis(*config['SET_TABLE_VEL']),
+    cache_dir=get_path(config, config['SET_TABLE_DIR']),
+  )
+
+
+def get_set_tables(config):
+  """
+  Load or build the SET tables for both clothing and activity levels and
+  the comfort bounds, e.g. once before fanning out to workers
+  """
+  if config['SPEED'] != 'SLOW' or config['COMFORT_MODEL'] != 'SET':
+    return
+  if config['SET_TABLE']:
+    get_set_table(config, config['MIN_METABOLIC_RATE'], config['MIN_CLOTHING_RATING'])
+    get_set_table(config, config['MAX_METABOLIC_RATE'], config['MAX_CLOTHING_RATING'])
+  if config['COMFORT_BOUNDS']:
+    get_comfort_bounds(config)
+
+
+def get_comfort_bounds(config):
+  return comfort_bounds.get_comfort_bounds(
+    desired_set=config['DESIRED_STANDARD_EFFECTIVE_TEMPERATURE'],
+    cool=(config['MIN_METABOLIC_RATE'], config['MIN_CLOTHING_RATING']),
+    warm=(config['MAX_METABOLIC_RATE'], config['MAX_CLOTHING_RATING']),
+    ta_axis=set_table.get_axis(*config['COMFORT_BOUNDS_TA']),
+    rh_axis=set_table.get_axis(*config['COMFORT_BOUNDS_RH']),
+    vel_axis=set_table.get_axis(*config['COMFORT_BOUNDS_VEL']),
+    cache_dir=get_path(config, config['SET_TABLE_DIR']),
+  )
+
+
+def standard_effective_temperature(config, dry_bulb_c, rhum_percent, wspd_m_s, met, clo):
+  if config['SET_TABLE']:
+    # Exact wherever the table could put the SET on the wrong side of the desired SET
+    return get_set_table(config, met, clo).set(
+      dry_bulb_c,
+      rhum_percent,
+      wspd_m_s,
+      threshold=config['DESIRED_STANDARD_EFFECTIVE_TEMPERATURE'],
+      margin=config['SET_TABLE_ERROR_MARGIN'],
+      min_margin=config['SET_TABLE_MIN_MARGIN'],
+    )
+  return comfort_models.comfPMVElevatedAirspeed(
+    ta=dry_bulb_c,
+    tr=dry_bulb_c,
+    vel=wspd_m_s,
+    rh=rhum_percent,
+    met=met,
+    clo=clo,
+    wme=0,  # This is like the heat generated (in MET units) by rubbing sandpaper against wood.  In practice, assume zero.
+    outputs=('set',)  # Only SET is used, so skip the cooling effect root-finding
+  )[0]
+
+
+def standard_effective_temperatures(config, dry_bulb_c, rhum_percent, wspd_m_s, met, clo):
+  """
+  standard_effective_temperature() for arrays of hours, NaN where the
+  comfort model fails
+  """
+  if len(dry_bulb_c) == 0:
+    return numpy.zeros(0)
+  if config['SET_TABLE']:
+    return standard_effective_temperature(config, dry_bulb_c, rhum_percent, wspd_m_s, met, clo)
+  return comfort_models.comfPierceSETArray(
+    ta=dry_bulb_c,
+    tr=dry_bulb_c,
+    vel=wspd_m_s,
+    rh=rhum_percent,
+    met=met,
+    clo=clo,
+    wme=0,
+  )
+
+
+def comfy(config, dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour):
+  """
+  Whether one hour is comfy. evaluate_hours() gives the same answer for
+  many hours at once.
+  """
+  # Allow for longer summer days having nice evenings
+  if etr_w_m2 < config['MIN_ETR'] or hour < config['EARLIEST_HOUR']:
+    return False
+
+  # Shortcut calculating expensive things
+  if dew_point_c > config['MAX_DEW_POINT'] or \
+      lprecip_depth_mm > config['MAX_RAIN_DEPTH'] or \
+      wspd_m_s > config['MAX_WIND_SPEED']:
+    return False
+
+  if config['SPEED'] == 'FAST':
+    if config['MIN_DRY_BULB_C'] <= dry_bulb_c <= config['MAX_DRY_BULB_C'] and \
+      dew_point_c < config['MAX_DEW_POINT'] and \
+      wspd_m_s < config['MAX_WINDSPEED_MS'] and \
+      lprecip_depth_mm == config['MAX_LIQUID_PRECIP_MM'] and \
+      config['EARLIEST_HOUR'] <= hour <= config['LATEST_HOUR']:
+      return True
+    else:
+      return False
+  elif config['COMFORT_MODEL'] == 'UTCI':
+    # Outdoors, with the mean radiant temperature taken as the air temperature
+    utci = comfort_models.comfUTCI(dry_bulb_c, dry_bulb_c, wspd_m_s, rhum_percent)[0]
+    return utci is not None and config['MIN_UTCI'] < utci < config['MAX_UTCI']
+  else:
+    try:
+      how_you_would_feel_dressed_cool_walking_slow=standard_effective_temperature(
+        config,
+        dry_bulb_c=dry_bulb_c,
+        rhum_percent=rhum_percent,
+        wspd_m_s=wspd_m_s,
+        met=config['MIN_METABOLIC_RATE'],
+        clo=config['MIN_CLOTHING_RATING'],
+      )
+    except ArithmeticError:
+      log.warning(f'could not calculate this data: ta={dry_bulb_c}, tr={dry_bulb_c}, vel={wspd_m_s}, rh={rhum_percent},met={config["MIN_METABOLIC_RATE"]},clo={config["MIN_CLOTHING_RATING"]},wme=0)')
+      return False
+
+    # shortcut calculation of more complex things
+    if how_you_would_feel_dressed_cool_walking_slow > config['DESIRED_STANDARD_EFFECTIVE_TEMPERATURE']:
+      return False
+
+    try:
+      how_you_would_feel_dressed_warm_walking_fast=standard_effective_temperature(
+        config,
+        dry_bulb_c=dry_bulb_c,
+        rhum_percent=rhum_percent,
+        wspd_m_s=wspd_m_s,
+        met=config['MAX_METABOLIC_RATE'],
+        clo=config['MAX_CLOTHING_RATING'],
+      )
+    except ArithmeticError:
+      log.warning(f'could not calculate this data: ta={dry_bulb_c}, tr={dry_bulb_c}, vel={wspd_m_s}, rh={rhum_percent},met={config["MAX_METABOLIC_RATE"]},clo={config["MAX_CLOTHING_RATING"]},wme=0)')
+      return False
+
+
+    if how_you_would_feel_dressed_cool_walking_slow <= config['DESIRED_STANDARD_EFFECTIVE_TEMPERATURE'] <= how_you_would_feel_dressed_warm_walking_fast:
+      return True
+    else:
+      return False
+
+
+def evaluate_hours(config, dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour):
+  """
+  comfy() for a whole station's hours at once: the cheap gates are applied
+  as boolean masks and only the hours that pass them go to the comfort
+  model, in one batch per metabolic rate and clothing rating.
+
+  Returns a boolean array with one element per hour, in the broadcast shape
+  of the arguments.
+  """
+  dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour = numpy.broadcast_arrays(
+    dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour)
+  shape = dry_bulb_c.shape
+  dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour = [
+    x.ravel() for x in (dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour)]
+
+  # Same comparisons as comfy(), so missing values gate the same way
+  candidates = ~(etr_w_m2 < config['MIN_ETR']) & ~(hour < config['EARLIEST_HOUR'])
+  candidates &= ~(dew_point_c > config['MAX_DEW_POINT']) & \
+    ~(lprecip_depth_mm > config['MAX_RAIN_DEPTH']) & \
+    ~(wspd_m_s > config['MAX_WIND_SPEED'])
+
+  if config['SPEED'] == 'FAST':
+    return (candidates & \
+      (config['MIN_DRY_BULB_C'] <= dry_bulb_c) & (dry_bulb_c <= config['MAX_DRY_BULB_C']) & \
+      (dew_point_c < config['MAX_DEW_POINT']) & \
+      (wspd_m_s < config['MAX_WINDSPEED_MS']) & \
+      (lprecip_depth_mm == config['MAX_LIQUID_PRECIP_MM']) & \
+      (config['EARLIEST_HOUR'] <= hour) & (hour <= config['LATEST_HOUR'])).reshape(shape)
+
+  if config['COMFORT_MODEL'] == 'UTCI':
+    index = numpy.flatnonzero(candidates)
+    utci = comfort_models.comfUTCIArray(dry_bulb_c[index], dry_bulb_c[index], wspd_m_s[index], rhum_percent[index])[0]
+    comfy_flags = numpy.zeros(len(candidates), dtype=bool)
+    comfy_flags[index] = (config['MIN_UTCI'] < utci) & (utci < config['MAX_UTCI'])
+    log.info(f'{len(candidates)} hours, {candidates.sum()} passed the gates, {comfy_flags.sum()} comfy')
+    return comfy_flags.reshape(shape)
+
+  comfy_flags = numpy.zeros(len(candidates), dtype=bool)
+  index = numpy.flatnonzero(candidates)
+  if config['COMFORT_BOUNDS']:
+    # Settle the hours clear of the comfy temperature range's bounds, and
+    # only run the comfort model for the rest
+    bounded_comfy, decided = get_comfort_bounds(config).classify(
+      dry_bulb_c[index],
+      rhum_percent[index],
+      wspd_m_s[index],
+      margin=config['COMFORT_BOUNDS_MARGIN'],
+    )
+    comfy_flags[index[decided]] = bounded_comfy[decided]
+    log.info(f'{decided.sum()} of {len(index)} hours decided by the comfort bounds')
+    index = index[~decided]
+
+  how_you_would_feel_dressed_cool_walking_slow = standard_effective_temperatures(
+    config,
+    dry_bulb_c=dry_bulb_c[index],
+    rhum_percent=rhum_percent[index],
+    wspd_m_s=wspd_m_s[index],
+    met=config['MIN_METABOLIC_RATE'],
+    clo=config['MIN_CLOTHING_RATING'],
+  )
+
+  # Only hours that aren't too warm dressed cool can be comfy
+  index = index[how_you_would_feel_dressed_cool_walking_slow <= config['DESIRED_STANDARD_EFFECTIVE_TEMPERATURE']]
+  how_you_would_feel_dressed_warm_walking_fast = standard_effective_temperatures(
+    config,
+    dry_bulb_c=dry_bulb_c[index],
+    rhum_percent=rhum_percent[index],
+    wspd_m_s=wspd_m_s[index],
+    met=config['MAX_METABOLIC_RATE'],
+    clo=config['MAX_CLOTHING_RATING'],
+  )
+  comfy_flags[index] = config['DESIRED_STANDARD_EFFECTIVE_TEMPERATURE'] <= how_you_would_feel_dressed_warm_walking_fast
+
+  log.info(f'{len(candidates)} hours, {candidates.sum()} passed the gates, {comfy_flags.sum()} comfy')
+  return comfy_flags.reshape(shape)
+
+
+## Aggregate
+############
+def aggregate_days(config, comfy_flags, month_of_day):
+  """
+  Count comfy days from a (days, 24) array of comfy hours.
+
+  Returns the comfy days per month, the days per month and the months
+  (in calendar order) as arrays, plus the comfy day flags.
+  """
+  comfy_days = comfy_flags.sum(axis=1) >= config['MIN_COMFY_HOURS']
+  month_starts = numpy.flatnonzero(numpy.diff(month_of_day, prepend=0))
+  comfy_days_in_months = numpy.add.reduceat(comfy_days.astype(numpy.int64), month_starts)
+  total_days_in_months = numpy.diff(numpy.append(month_starts, len(month_of_day)))
+  return comfy_days_in_months, total_days_in_months, month_of_day[month_starts], comfy_days
+
+
+def print_comfy_days(comfy_days, months, total_days_in_months):
+  print('\n\n\n')
+  day = 0
+  for month, total_days_in_month in zip(months, total_days_in_months):
+    print(f'month {month:02} ({calendar.month_abbr[month]}): ' + ''.join('C' if comfy_day else '.' for comfy_day in comfy_days[day:day + total_days_in_month]))
+    day += total_days_in_month
+
+
+## Report
+#########
+def report_row(config, station_meta, comfy_days_in_months, total_days_in_months):
+  """
+  Returns the station's comfyness report row: its meta, then REPORT_COLUMNS
+  """
+  comfy_days_in_year = int(comfy_days_in_months.sum())
+  comfy_days_in_months_percent = [
+    round((comfy_days_in_month/total_days_in_month)*100)
+    for comfy_days_in_month, total_days_in_month in zip(comfy_days_in_months.tolist(), total_days_in_months.tolist())
+  ]
+  comfy_months_in_year_count = sum(percent >= config['MIN_COMFY_DAYS_PER_MONTH_PERCENT'] for percent in comfy_days_in_months_percent)
+  comfy_days_in_year_percent = round((comfy_days_in_year/365)*100)
+  comfy_months_in_year_percent = round((comfy_months_in_year_count/12)*100)
+
+  log.info(f'\n  Typical year: {comfy_days_in_year} comfy days   ({comfy_days_in_year_percent: >3}%)')
+  log.info(f'                  {comfy_months_in_year_count} comfy months ({comfy_months_in_year_percent: >3}%)\n\n')
+
+  return (station_meta + [comfy_days_in_year, comfy_months_in_year_count, comfy_days_in_year_percent, comfy_months_in_year_percent] + comfy_days_in_months_percent)
+
+
+def process_station(config, sample_file):
+  """
+  Run every stage for one TMY3 file.
+
+  Returns (file_code, report row, ComfyHours), or None if the file can't be
+  used.
+  """
+  try:
+    station = parse_station(config, sample_file)
+  except ValueError as e:
+    log.warning(f'skipping {sample_file}: {e}')
+    return None
+
+  log.info(f'calculate comfyness for {station.file_code}: {station.meta_header["station_name"]}, {station.meta_header["station_state"]} - start')
+
+  comfy_flags = evaluate_hours(config, hour=numpy.arange(24), **station.hours)
+  comfy_days_in_months, total_days_in_months, months, comfy_days = aggregate_days(config, comfy_flags, station.month_of_day)
+
+  log.info(f'\n\nReport for {station.file_code}: {station.meta_header["station_name"]}, {station.meta_header["station_state"]}:\n')
+  if config['MODE'] == 'DATA_ONE':
+    print_comfy_days(comfy_days, months, total_days_in_months)
+  for month, comfy_days_in_month in zip(months, comfy_days_in_months):
+    log.info(f'  month {month:02} ({calendar.month_abbr[month]}): {comfy_days_in_month: >2} comfy days')
+
+  row = report_row(config, station.station_meta, comfy_days_in_months, total_days_in_months)
+  log.info(f'calculate comfyness for {station.file_code}: {station.meta_header["station_name"]}, {station.meta_header["station_state"]} - done')
+  return station.file_code, row, pack_comfy_hours(station, comfy_flags)
+
+
+def map_stations(config, process, files_list, workers=1, progress=None):
+  """
+  Yields process(config, file) for every file in order, over a pool of
+  `workers` processes. `progress` is called once per file.
+  """
+  if workers > 1:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+      for result in executor.map(functools.partial(process, config), files_list):
+        yield result
+        if progress:
+          progress()
+  else:
+    for sample_file in files_list:
+      yield process(config, sample_file)
+      if progress:
+        progress()
+
+
+def run_stations(config, files_list, workers=1, progress=None, comfy_hours=None):
+  """
+  process_station() for every file, over a pool of `workers` processes.
+
+  Returns the comfyness report: file_code -> report row, in file order.
+  `progress` is called once per file. If `comfy_hours` is a dict, each
+  station's ComfyHours is added to it by file_code.
+  """
+  # Build any missing SET tables once here rather than in every worker
+  get_set_tables(config)
+
+  comfyness_report = {}
+  for result in map_stations(config, process_station, files_list, workers, progress):
+    if result:
+      comfyness_report[result[0]] = result[1]
+      if comfy_hours is not None:
+        comfy_hours[result[0]] = result[2]
+  return comfyness_report
+
+
+def report(config, comfyness_report):
+  return pandas.DataFrame.from_dict(
+    data=comfyness_report,
+    orient='index',
+    columns=(config['META_HEADER_ROWS'] + REPORT_COLUMNS)
+  )
+
+
+## Comfort profile sweep
+########################
+def get_profiles(config):
+  """
+  Returns (name, config) for each of COMFORT_PROFILES: the config with the
+  profile's settings. Raises ValueError for a setting a sweep can't vary.
+  """
+  profiles = []
+  for profile in config['COMFORT_PROFILES']:
+    settings = dict((key, value) for key, value in profile.items() if key != 'NAME')
+    unknown = set(settings) - set(PROFILE_KEYS)
+    if unknown:
+      raise ValueError(f'comfort profile {profile["NAME"]} sets {", ".join(sorted(unknown))}, a sweep can only vary {", ".join(PROFILE_KEYS)}')
+    profiles.append((profile['NAME'], dict(config, **settings)))
+  return profiles
+
+
+def evaluate_profiles(config, profiles, dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour):
+  """
+  evaluate_hours() for every profile config at once. The gates don't
+  depend on the profile, so they're applied once, then the SET of the
+  hours that pass is calculated for every profile in one batch by
+  broadcasting the metabolic rates and clothing ratings over a profile axis.
+
+  Returns a boolean array with a leading profile axis, then the broadcast
+  shape of the arguments.
+  """
+  if config['SPEED'] != 'SLOW' or config['COMFORT_MODEL'] != 'SET':
+    raise ValueError('a comfort profile sweep needs SPEED SLOW and COMFORT_MODEL SET')
+
+  dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour = numpy.broadcast_arrays(
+    dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour)
+  shape = dry_bulb_c.shape
+  dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour = [
+    x.ravel() for x in (dry_bulb_c, dew_point_c, rhum_percent, wspd_m_s, lprecip_depth_mm, etr_w_m2, hour)]
+
+  # Same gates as evaluate_hours()
+  candidates = ~(etr_w_m2 < config['MIN_ETR']) & ~(hour < config['EARLIEST_HOUR'])
+  candidates &= ~(dew_point_c > config['MAX_DEW_POINT']) & \
+    ~(lprecip_depth_mm > config['MAX_RAIN_DEPTH']) & \
+    ~(wspd_m_s > config['MAX_WIND_SPEED'])
+  index = numpy.flatnonzero(candidates)
+
+  def profile_axis(key):
+    return numpy.array([profile_config[key] for name, profile_config in profiles], dtype=numpy.float64)[:, numpy.newaxis]
+
+  desired_set = profile_axis('DESIRED_STANDARD_EFFECTIVE_TEMPERATURE')
+  how_you_would_feel_dressed_cool_walking_slow = comfort_models.comfPierceSETArray(
+    dry_bulb_c[index], dry_bulb_c[index], wspd_m_s[index], rhum_percent[index],
+    profile_axis('MIN_METABOLIC_RATE'), profile_axis('MIN_CLOTHING_RATING'), 0)
+  how_you_would_feel_dressed_warm_walking_fast = comfort_models.comfPierceSETArray(
+    dry_bulb_c[index], dry_bulb_c[index], wspd_m_s[index], rhum_percent[index],
+    profile_axis('MAX_METABOLIC_RATE'), profile_axis('MAX_CLOTHING_RATING'), 0)
+
+  comfy_flags = numpy.zeros((len(profiles), len(candidates)), dtype=bool)
+  comfy_flags[:, index] = (how_you_would_feel_dressed_cool_walking_slow <= desired_set) & \
+    (desired_set <= how_you_would_feel_dressed_warm_walking_fast)
+  return comfy_flags.reshape((len(profiles),) + shape)
+
+
+def process_station_profiles(config, sample_file):
+  """
+  Parse one TMY3 file and run the remaining stages for every comfort
+  profile.
+
+  Returns (file_code, {profile name: report row}), or None if the file
+  can't be used.
+  """
+  try:
+    station = parse_station(config, sample_file)
+  except ValueError as e:
+    log.warning(f'skipping {sample_file}: {e}')
+    return None
+
+  profiles = get_profiles(config)
+  comfy_flags = evaluate_profiles(config, profiles, hour=numpy.arange(24), **station.hours)
+  rows = {}
+  for (name, profile_config), profile_comfy_flags in zip(profiles, comfy_flags):
+    comfy_days_in_months, total_days_in_months, months, comfy_days = aggregate_days(profile_config, profile_comfy_flags, station.month_of_day)
+    rows[name] = report_row(profile_config, station.station_meta, comfy_days_in_months, total_days_in_months)
+  return station.file_code, rows
+
+
+def run_sweep(config, files_list, workers=1, progress=None):
+  """
+  process_station_profiles() for every file, over a pool of `workers`
+  processes.
+
+  Returns profile name -> comfyness report (file_code -> report row), in
+  COMFORT_PROFILES and file order.
+  """
+  sweep_report = dict((name, {}) for name, profile_config in get_profiles(config))
+  for result in map_stations(config, process_station_profiles, files_list, workers, progress):
+    if result:
+      for name, row in result[1].items():
+        sweep_report[name][result[0]] = row
+  return sweep_report
+
+
+def long_report(config, sweep_report):
+  """
+  Every profile's report in one table, with the profile name as the first
+  column
+  """
+  return pandas.concat([
+    report(config, comfyness_report).rename_axis('file_code').reset_index().assign(profile=name)
+    for name, comfyness_report in sweep_report.items()
+  ], ignore_index=True).set_index(['profile', 'file_code'])
+
+
+## Comfy hour bitsets
+#####################
+def pack_comfy_hours(station, comfy_flags):
+  return ComfyHours(
+    station_meta=station.station_meta,
+    month_of_day=station.month_of_day.astype(numpy.uint8),
+    bits=numpy.packbits(comfy_flags.ravel()),
+  )
+
+
+def unpack_comfy_hours(bits, days=365):
+  """
+  Returns the comfy flags of `bits` (or a stack of them) as (..., days, 24)
+  """
+  return numpy.unpackbits(bits, axis=-1, count=days * 24).view(bool).reshape(bits.shape[:-1] + (days, 24))
+
+
+def save_comfy_hours(config, comfy_hours, filepath):
+  """
+  Save every station's comfy hours, with the config they were calculated
+  with, to one .npz: about 1.1 KB per station
+  """
+  file_codes = list(comfy_hours)
+  # A run where no station could be read still gets a file, with no stations
+  # in it, as numpy.stack needs at least one array
+  numpy.savez_compressed(
+    filepath,
+    file_codes=numpy.array(file_codes, dtype=str),
+    bits=numpy.stack([comfy_hours[file_code].bits for file_code in file_codes]) if file_codes else numpy.zeros((0, 0), dtype=numpy.uint8),
+    month_of_day=numpy.stack([comfy_hours[file_code].month_of_day for file_code in file_codes]) if file_codes else numpy.zeros((0, 0), dtype=numpy.uint8),
+    station_meta=numpy.array(json.dumps([comfy_hours[file_code].station_meta for file_code in file_codes])),
+    config=numpy.array(json.dumps(config)),
+  )
+
+
+def load_comfy_hours(filepath):
+  """
+  Returns the config and the comfy hours (file_code -> ComfyHours) written
+  by save_comfy_hours
+  """
+  with numpy.load(filepath) as npz:
+    config = json.loads(str(npz['config']))
+    comfy_hours = dict(
+      (str(file_code), ComfyHours(station_meta=station_meta, month_of_day=month_of_day, bits=bits))
+      for file_code, station_meta, month_of_day, bits in zip(npz['file_codes'], json.loads(str(npz['station_meta'])), npz['month_of_day'], npz['bits'])
+    )
+  return config, comfy_hours
+
+
+def reaggregate(config, comfy_hours):
+  """
+  The comfyness report from saved comfy hours, counting the days and months
+  with the thresholds in `config` (e.g. another MIN_COMFY_HOURS or
+  MIN_COMFY_DAYS_PER_MONTH_PERCENT) instead of evaluating the hours again.
+  """
+  comfyness_report = {}
+  for file_code, station_comfy_hours in comfy_hours.items():
+    comfy_flags = unpack_comfy_hours(station_comfy_hours.bits, days=len(station_comfy_hours.month_of_day))
+    comfy_days_in_months, total_days_in_months, months, comfy_days = aggregate_days(config, comfy_flags, station_comfy_hours.month_of_day)
+    comfyness_report[file_code] = report_row(config, list(station_comfy_hours.station_meta), comfy_days_in_months, total_days_in_months)
+  return comfyness_report
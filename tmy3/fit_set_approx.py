@@ -0,0 +1,89 @@
+"""
+Build the comfPierceSET_approx tables for the metabolic rates and clothing
+ratings in the config, over the SET table's air temperature and humidity
+ranges and air speeds up to --max-vel, and write them to
+comfort_models/set_approx/.
+
+Each table is checked against comfPierceSETArray on a random sample, and the
+max, 99th percentile and RMS errors are printed, along with how often the
+error is more than the one comfPierceSET_approx returns.
+"""
+import os
+import glob
+import argparse
+import numpy
+import comfort_models
+from comfort_models import set_table
+import engine
+
+
+def sample(rng, ta_axis, rh_axis, log_vel_axis, num):
+  """
+  Uniform in ta, rh and log(vel), like the tables' axes
+  """
+  return (
+    rng.uniform(ta_axis[0], ta_axis[-1], num),
+    rng.uniform(rh_axis[0], rh_axis[-1], num),
+    numpy.exp(rng.uniform(log_vel_axis[0], log_vel_axis[-1], num)),
+  )
+
+
+def measure(rng, met, clo, ta_axis, rh_axis, log_vel_axis, num):
+  """
+  :return: max, 99th percentile and RMS error of comfPierceSET_approx, and
+    the fraction of errors more than the one it returns
+  """
+  ta, rh, vel = sample(rng, ta_axis, rh_axis, log_vel_axis, num)
+  approx, bound = comfort_models.comfPierceSET_approx(ta, ta, vel, rh, met, clo, 0, returnError=True)
+  errors = numpy.abs(approx - comfort_models.comfPierceSETArray(ta, ta, vel, rh, met, clo, 0))
+  measured = ~numpy.isnan(errors)
+  errors, bound = errors[measured], bound[measured]
+  return (float(errors.max()), float(numpy.percentile(errors, 99)), float(numpy.sqrt(numpy.mean(errors ** 2))),
+          float(numpy.mean(errors > bound)))
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--config', dest='config', default=engine.CONFIG_YAML_FILE_DEFAULT_PATH, required=False)
+  parser.add_argument('--ta-step', dest='ta_step', type=float, default=1, required=False,
+                      help='Air temperature step of the tables (C)')
+  parser.add_argument('--rh-step', dest='rh_step', type=float, default=5, required=False,
+                      help='Relative humidity step of the tables (%%)')
+  parser.add_argument('--max-vel', dest='max_vel', type=float, default=30, required=False,
+                      help='Fastest air speed in the tables, past the SET table\'s so stormy hours needn\'t fall back to the exact model (m/s)')
+  parser.add_argument('--vel-points', dest='vel_points', type=int, default=25, required=False,
+                      help='Air speeds in each table, evenly spaced in log(vel)')
+  parser.add_argument('--samples', dest='samples', type=int, default=200000, required=False,
+                      help='Random conditions each table is checked on')
+  parser.add_argument('--output', dest='output', default=comfort_models.SET_APPROX_DIR, required=False)
+  args = parser.parse_args()
+
+  config = engine.load_config(args.config)
+  ta_axis = numpy.arange(config['SET_TABLE_TA'][0], config['SET_TABLE_TA'][1] + args.ta_step / 2, args.ta_step)
+  rh_axis = numpy.arange(config['SET_TABLE_RH'][0], config['SET_TABLE_RH'][1] + args.rh_step / 2, args.rh_step)
+  log_vel_axis = numpy.linspace(numpy.log(config['SET_TABLE_VEL'][0]), numpy.log(args.max_vel), args.vel_points)
+  pairs = [
+    (config['MIN_METABOLIC_RATE'], config['MIN_CLOTHING_RATING']),
+    (config['MAX_METABOLIC_RATE'], config['MAX_CLOTHING_RATING']),
+  ]
+
+  tables = [set_table.SetTable.build(met, clo, ta_axis, rh_axis, numpy.exp(log_vel_axis)) for met, clo in pairs]
+
+  # Measure the new tables rather than the ones on disk
+  comfort_models.comfort_models.SET_APPROX = tables
+  rng = numpy.random.default_rng(0)
+  for table in tables:
+    max_error, p99_error, rms_error, over_bound = measure(rng, table.met, table.clo, ta_axis, rh_axis, log_vel_axis, args.samples)
+    print(f'met={table.met}, clo={table.clo}: max error {max_error:.3f} C, 99th percentile {p99_error:.3f} C, RMS error {rms_error:.3f} C, '
+          f'more than the returned error {over_bound:.4%} of the time')
+
+  os.makedirs(args.output, exist_ok=True)
+  for filepath in glob.glob(os.path.join(args.output, '*.npz')):
+    os.remove(filepath)
+  for table in tables:
+    table.save(os.path.join(args.output, f'set_approx_met{table.met}_clo{table.clo}.npz'))
+  print(f'wrote {args.output}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,35 @@
+import os
+import argparse
+import timeit
+import engine
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Count comfy days and months again from the comfy hours a climatefind.py run saved, for other thresholds')
+  parser.add_argument('comfy_hours', help='.comfy_hours.npz written next to a climatefind.py report')
+  parser.add_argument('--min-comfy-hours', dest='min_comfy_hours', type=int, default=None, required=False,
+                      help='Comfy hours for a comfy day (default: the run\'s MIN_COMFY_HOURS)')
+  parser.add_argument('--min-comfy-days-per-month-percent', dest='min_comfy_days_per_month_percent', type=float, default=None, required=False,
+                      help='Percent of comfy days for a comfy month (default: the run\'s MIN_COMFY_DAYS_PER_MONTH_PERCENT)')
+  parser.add_argument('--output', dest='output', default=None, required=False,
+                      help='Report to write (default: next to the comfy hours, named after the thresholds)')
+  args = parser.parse_args()
+
+  start_time = timeit.default_timer()
+  config, comfy_hours = engine.load_comfy_hours(args.comfy_hours)
+  if args.min_comfy_hours is not None:
+    config['MIN_COMFY_HOURS'] = args.min_comfy_hours
+  if args.min_comfy_days_per_month_percent is not None:
+    config['MIN_COMFY_DAYS_PER_MONTH_PERCENT'] = args.min_comfy_days_per_month_percent
+
+  comfyness_report = engine.reaggregate(config, comfy_hours)
+  output_file_path = args.output or (
+    f'{args.comfy_hours[:-len(".comfy_hours.npz")]}'
+    f'_hours{config["MIN_COMFY_HOURS"]}_days{config["MIN_COMFY_DAYS_PER_MONTH_PERCENT"]}.{config["OUTPUT_EXT"]}'
+  )
+  engine.report(config, comfyness_report).to_csv(output_file_path)
+  print(f'wrote {len(comfyness_report)} stations to {output_file_path} in {round((timeit.default_timer() - start_time) * 1000)}ms')
+
+
+if __name__ == '__main__':
+  main()
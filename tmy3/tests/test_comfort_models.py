@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# Core
+import os
+
+# Contrib
+import numpy
+import pandas
+
+# Custom
+import comfort_models
+from comfort_models import set_table
+import comfort_bounds
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TMY3_DIR = os.path.dirname(THIS_DIR)
+
+# Every 20th hour of a real station-year
+station_hours = pandas.read_csv(f'{TMY3_DIR}/data/small/denver.CSV', header=1).iloc[::20]
+ta = station_hours['Dry-bulb (C)'].to_numpy()
+rh = station_hours['RHum (%)'].to_numpy()
+vel = station_hours['Wspd (m/s)'].to_numpy()
+
+def scalar_set(ta, tr, vel, rh, met, clo, wme):
+  try:
+    return comfort_models.comfPierceSET(ta, tr, vel, rh, met, clo, wme)
+  except ArithmeticError:
+    return numpy.nan
+
+def test_comf_pierce_set_array():
+  for met, clo in ((3.01, 0.4), (5.01, 0.8), (1.0, 0.0)):
+    expected = numpy.array([scalar_set(t, t, v, r, met, clo, 0) for t, v, r in zip(ta, vel, rh)])
+    actual = comfort_models.comfPierceSETArray(ta, ta, vel, rh, met, clo, 0)
+    assert actual.shape == ta.shape
+    assert numpy.allclose(actual, expected, rtol=0, atol=1e-6, equal_nan=True)
+
+def test_comf_pierce_set_array_broadcasts():
+  actual = comfort_models.comfPierceSETArray(ta[:, numpy.newaxis], ta[:, numpy.newaxis], vel[:, numpy.newaxis], rh[:, numpy.newaxis], numpy.array([3.01, 5.01]), numpy.array([0.4, 0.8]), 0)
+  assert actual.shape == (len(ta), 2)
+  assert actual[0, 1] == comfort_models.comfPierceSETArray(ta[0], ta[0], vel[0], rh[0], 5.01, 0.8, 0)
+
+def test_comf_pmv_array():
+  for met, clo in ((1.1, 0.5), (3.01, 0.4), (1.0, 0.0)):
+    pmv, ppd = comfort_models.comfPMVArray(ta, ta, vel, rh, met, clo, 0)
+    expected = numpy.array([comfort_models.comfPMV(*x, met, clo, 0) for x in zip(ta, ta, vel, rh)])
+    assert numpy.allclose(pmv, expected[:, 0], rtol=0, atol=1e-9)
+    assert numpy.allclose(ppd, expected[:, 1], rtol=0, atol=1e-9)
+
+  pmv, ppd = comfort_models.comfPMVArray(22.0, 22.0, [[0.1], [0.5]], [40, 60, 80], 1.1, 0.5, 0)
+  assert pmv.shape == (2, 3)
+  assert numpy.isclose(pmv[1, 2], comfort_models.comfPMV(22.0, 22.0, 0.5, 80, 1.1, 0.5, 0)[0])
+  assert isinstance(comfort_models.comfPMVArray(22.0, 22.0, 0.1, 40, 1.1, 0.5, 0)[0], float)
+
+def test_comf_pmv_elevated_airspeed_outputs():
+  full = comfort_models.comfPMVElevatedAirspeed(24.0, 24.0, 1.5, 40, 3.01, 0.4, 0)
+  assert comfort_models.comfPMVElevatedAirspeed(24.0, 24.0, 1.5, 40, 3.01, 0.4, 0, outputs=('set',)) == [full[2]]
+  assert comfort_models.comfPMVElevatedAirspeed(24.0, 24.0, 1.5, 40, 3.01, 0.4, 0, outputs=('ce', 'pmv')) == [full[4], full[0]]
+
+def test_set_table(tmp_path):
+  axes = (set_table.get_axis(-10, 40, 51), set_table.get_axis(0, 100, 11), set_table.get_log_axis(0.1, 10.1, 11))
+  table = set_table.get_set_table(3.01, 0.4, *axes, cache_dir=str(tmp_path))
+  assert len(list(tmp_path.glob('set_table_*.npz'))) == 1
+  assert set_table.get_set_table(3.01, 0.4, *axes, cache_dir=str(tmp_path)) is table
+  loaded = set_table.SetTable.load(str(next(tmp_path.glob('set_table_*.npz'))))
+  assert numpy.array_equal(loaded.values, table.values)
+
+  expected = comfort_models.comfPierceSETArray(ta, ta, vel, rh, 3.01, 0.4, 0)
+  inside = ~numpy.isnan(table.interpolate(ta, rh, vel))
+  assert numpy.all(numpy.abs(table.interpolate(ta, rh, vel) - expected)[inside] <= 2 * table.max_error)
+  actual = table.set(ta, rh, vel, threshold=25.6, margin=2)
+  assert numpy.array_equal(actual > 25.6, expected > 25.6)
+  assert numpy.allclose(actual[~inside], expected[~inside])
+
+  # Scalars in, scalars out
+  assert table.interpolate(20.0, 50, 1.0) == table.interpolate([20.0], [50], [1.0])[0]
+  assert table.error(20.0, 50, 1.0) == table.error([20.0], [50], [1.0])[0]
+  assert numpy.isnan(table.interpolate(60.0, 50, 1.0)) and numpy.isnan(table.error(60.0, 50, 1.0))
+
+  # Random points, thresholds on both sides of where SET jumps between solutions
+  rng = numpy.random.default_rng(0)
+  random_ta = rng.uniform(-10, 40, 20000)
+  random_rh = rng.uniform(0, 100, 20000)
+  random_vel = rng.uniform(0, 10.1, 20000)
+  expected = comfort_models.comfPierceSETArray(random_ta, random_ta, random_vel, random_rh, 3.01, 0.4, 0)
+  for threshold in (20.0, 24.0, 25.6, 30.0, 33.0):
+    actual = table.set(random_ta, random_rh, random_vel, threshold=threshold, margin=2, min_margin=0.05)
+    assert numpy.array_equal(actual > threshold, expected > threshold)
+
+def test_comf_utci_array():
+  utci, comfortable, stress_range = comfort_models.comfUTCIArray(ta, ta, vel, rh)
+  for i in range(len(ta)):
+    expected = comfort_models.comfUTCI(ta[i], ta[i], vel[i], rh[i])
+    assert abs(utci[i] - expected[0]) < 1e-9
+    assert comfortable[i] == expected[1]
+    assert stress_range[i] == expected[2]
+
+  # Outside the model's range, where comfUTCI gives None
+  assert comfort_models.comfUTCI(20.0, -20.0, 1.0, 50) == (None, None, None)
+  utci, comfortable, stress_range = comfort_models.comfUTCIArray(20.0, [20.0, -20.0], 1.0, 50)
+  assert not numpy.isnan(utci[0]) and numpy.isnan(utci[1])
+  assert not comfortable[1] and numpy.isnan(stress_range[1])
+
+def test_calc_humid_ratio_array():
+  pressure = numpy.linspace(80000, 101325, len(ta))
+  expected = comfort_models.calcHumidRatio(list(ta), list(rh), list(pressure))
+  actual = comfort_models.calcHumidRatioArray(ta, rh, pressure)
+  for expected_values, actual_values in zip(expected, actual):
+    assert numpy.allclose(actual_values, expected_values, rtol=1e-12, atol=0)
+
+  # Scalars broadcast against arrays, on both sides of freezing
+  humidity_ratio = comfort_models.calcHumidRatioArray([-5.0, 20.0], 50, 101325)[0]
+  assert numpy.allclose(humidity_ratio, comfort_models.calcHumidRatio([-5.0, 20.0], [50, 50], [101325, 101325])[0])
+
+def test_comf_pierce_set_approx():
+  for met, clo in ((3.01, 0.4), (5.01, 0.8)):
+    approx, error = comfort_models.comfPierceSET_approx(ta, ta, vel, rh, met, clo, 0, returnError=True)
+    expected = comfort_models.comfPierceSETArray(ta, ta, vel, rh, met, clo, 0)
+    tabled = error > 0
+    assert tabled.mean() > 0.9
+    assert numpy.sqrt(numpy.mean((approx - expected)[tabled] ** 2)) < 0.1
+    assert numpy.all(numpy.abs(approx - expected)[tabled] <= error[tabled])
+    assert numpy.array_equal(approx[~tabled], expected[~tabled], equal_nan=True)
+    # maxError=0 opts every element into the exact model
+    assert numpy.array_equal(comfort_models.comfPierceSET_approx(ta, ta, vel, rh, met, clo, 0, maxError=0), expected, equal_nan=True)
+
+  # Off the tables it is the exact model
+  assert comfort_models.comfPierceSET_approx(25.0, 25.0, 1.0, 50, 1.0, 0.5, 0) == comfort_models.comfPierceSETArray(25.0, 25.0, 1.0, 50, 1.0, 0.5, 0)
+  assert comfort_models.comfPierceSET_approx(25.0, 30.0, 1.0, 50, 3.01, 0.4, 0) == comfort_models.comfPierceSETArray(25.0, 30.0, 1.0, 50, 3.01, 0.4, 0)
+  assert comfort_models.comfPierceSET_approx(60.0, 60.0, 1.0, 50, 3.01, 0.4, 0, returnError=True)[1] == 0
+
+def test_comfort_bounds(tmp_path):
+  axes = (set_table.get_axis(-40, 60, 201), set_table.get_axis(0, 100, 11), set_table.get_axis(0.1, 10.1, 11))
+  bounds = comfort_bounds.get_comfort_bounds(25.6, (3.01, 0.4), (5.01, 0.8), *axes, cache_dir=str(tmp_path))
+  loaded = comfort_bounds.ComfortBounds.load(str(next(tmp_path.glob('comfort_bounds_*.npz'))))
+  assert numpy.array_equal(loaded.upper_min, bounds.upper_min)
+
+  comfy, decided = bounds.classify(ta, rh, vel, margin=0.5)
+  expected = (comfort_models.comfPierceSETArray(ta, ta, vel, rh, 3.01, 0.4, 0) <= 25.6) & \
+    (25.6 <= comfort_models.comfPierceSETArray(ta, ta, vel, rh, 5.01, 0.8, 0))
+  assert decided.mean() > 0.5
+  assert numpy.array_equal(comfy[decided], expected[decided])
+
+def test_comf_pierce_set_warm_start():
+  cold, state, minutes_saved = comfort_models.comfPierceSET(22.0, 22.0, 1.0, 40, 3.01, 0.4, 0, returnState=True)
+  assert cold == comfort_models.comfPierceSET(22.0, 22.0, 1.0, 40, 3.01, 0.4, 0)
+  assert minutes_saved == 0
+  assert set(state) == {'TempSkin', 'TempCore', 'SkinBloodFlow', 'ALFA', 'ESK', 'MSHIV'}
+
+  # Restarting from the end state of the same mild conditions settles early
+  warm, _, minutes_saved = comfort_models.comfPierceSET(22.0, 22.0, 1.0, 40, 3.01, 0.4, 0, initialState=state, tolerance=0.01, returnState=True)
+  assert minutes_saved > 0
+  assert abs(warm - cold) < 0.5
+
+  sets, minutes_saved = comfort_models.comfPierceSETSeries(ta, ta, vel, rh, 3.01, 0.4, 0)
+  assert len(sets) == len(ta)
+  assert minutes_saved > 0
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Core
+import os
+
+# Contrib
+import numpy
+
+# Custom
+import engine
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TMY3_DIR = os.path.dirname(THIS_DIR)
+DENVER = f'{TMY3_DIR}/data/small/denver.CSV'
+
+def get_config(**overrides):
+  config = engine.load_config()
+  config.update({'SPEED': 'SLOW', 'SET_TABLE': False, 'COMFORT_BOUNDS': False})
+  config.update(overrides)
+  return config
+
+def test_parse_station():
+  station = engine.parse_station(get_config(), DENVER)
+  assert station.file_code == 'denver'
+  assert station.station_meta == [725650.0, 'DENVER', 'CO', -7.0, 39.833, -104.65, 1650.0]
+  assert station.hours['dry_bulb_c'].shape == (365, 24)
+  assert station.hours['dry_bulb_c'].dtype == numpy.float32
+  assert station.hours['dry_bulb_c'][0, 0] == numpy.float32(-18.0)
+  assert numpy.array_equal(numpy.unique(station.month_of_day, return_counts=True)[1], [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def test_evaluate_hours():
+  for speed, comfort_model in (('SLOW', 'SET'), ('SLOW', 'UTCI'), ('FAST', 'SET')):
+    config = get_config(SPEED=speed, COMFORT_MODEL=comfort_model)
+    station = engine.parse_station(config, DENVER)
+    comfy_flags = engine.evaluate_hours(config, hour=numpy.arange(24), **station.hours)
+    # Every 7th hour through the scalar version
+    for day, hour in zip(*numpy.unravel_index(numpy.arange(0, 365 * 24, 7), (365, 24))):
+      assert comfy_flags[day, hour] == engine.comfy(config, hour=hour, **{column: float(values[day, hour]) for column, values in station.hours.items()})
+
+def test_evaluate_hours_comfort_bounds(tmp_path):
+  config = get_config()
+  station = engine.parse_station(config, DENVER)
+  expected = engine.evaluate_hours(config, hour=numpy.arange(24), **station.hours)
+  config = get_config(
+    COMFORT_BOUNDS=True,
+    COMFORT_BOUNDS_TA=[-40, 60, 201],
+    COMFORT_BOUNDS_RH=[0, 100, 11],
+    COMFORT_BOUNDS_VEL=[0.1, 10.1, 11],
+    SET_TABLE_DIR=str(tmp_path),
+  )
+  assert numpy.array_equal(engine.evaluate_hours(config, hour=numpy.arange(24), **station.hours), expected)
+
+def test_process_station():
+  file_code, row, comfy_hours = engine.process_station(get_config(), DENVER)
+  assert file_code == 'denver'
+  assert row[7:11] == [190, 6, 52, 50]
+  assert row[11:] == [26, 21, 45, 37, 94, 53, 55, 58, 80, 81, 37, 35]
+  assert comfy_hours.bits.nbytes == 365 * 24 // 8
+
+def test_reaggregate(tmp_path):
+  config = get_config()
+  comfy_hours = {}
+  comfyness_report = engine.run_stations(config, [DENVER], comfy_hours=comfy_hours)
+  engine.save_comfy_hours(config, comfy_hours, str(tmp_path / 'report.comfy_hours.npz'))
+  saved_config, saved_comfy_hours = engine.load_comfy_hours(str(tmp_path / 'report.comfy_hours.npz'))
+  assert engine.reaggregate(saved_config, saved_comfy_hours) == comfyness_report
+
+  # Another threshold gives what a whole run with it gives
+  saved_config['MIN_COMFY_HOURS'] = 4
+  saved_config['MIN_COMFY_DAYS_PER_MONTH_PERCENT'] = 30
+  assert engine.reaggregate(saved_config, saved_comfy_hours) == engine.run_stations(get_config(MIN_COMFY_HOURS=4, MIN_COMFY_DAYS_PER_MONTH_PERCENT=30), [DENVER])
+
+def test_save_comfy_hours_empty(tmp_path):
+  config = get_config()
+  engine.save_comfy_hours(config, {}, str(tmp_path / 'report.comfy_hours.npz'))
+  saved_config, saved_comfy_hours = engine.load_comfy_hours(str(tmp_path / 'report.comfy_hours.npz'))
+  assert saved_comfy_hours == {}
+  assert engine.reaggregate(saved_config, saved_comfy_hours) == {}
+
+def test_run_sweep():
+  config = get_config()
+  sweep_report = engine.run_sweep(config, [DENVER])
+  assert list(sweep_report) == [profile['NAME'] for profile in config['COMFORT_PROFILES']]
+  for name, profile_config in engine.get_profiles(config):
+    assert sweep_report[name] == engine.run_stations(profile_config, [DENVER])
+
+  table = engine.long_report(config, sweep_report)
+  assert table.loc[('default', 'denver'), 'comfy_days_in_year'] == 190
+  assert len(table) == len(sweep_report)